@@ -0,0 +1,28 @@
+"""Index improvement_scripts on (created_at, id) for keyset pagination
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-15 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Supports keyset pagination (ORDER BY created_at DESC, id DESC, (created_at, id) < (:cursor, :cursor_id))
+    op.create_index(
+        'ix_improvement_scripts_created_at_id',
+        'improvement_scripts',
+        ['created_at', 'id']
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_improvement_scripts_created_at_id', table_name='improvement_scripts')
@@ -0,0 +1,81 @@
+"""Store transcription segments as rows instead of a JSON column
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-15 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Segment reads/edits go through (transcription_id, segment_index)
+    op.create_index(
+        'ix_transcription_segments_transcription_id_segment_index',
+        'transcription_segments',
+        ['transcription_id', 'segment_index'],
+        unique=True
+    )
+    
+    # Backfill rows from the JSON column
+    op.execute("""
+        INSERT INTO transcription_segments (
+            id, transcription_id, segment_index, start_time, end_time, text,
+            speaker, speaker_confidence, is_edited, original_text
+        )
+        SELECT
+            gen_random_uuid()::text,
+            t.id,
+            seg.idx - 1,
+            COALESCE((seg.value->>'start')::float, 0),
+            COALESCE((seg.value->>'end')::float, 0),
+            COALESCE(seg.value->>'text', ''),
+            seg.value->>'speaker',
+            (seg.value->>'speaker_confidence')::float,
+            COALESCE((seg.value->>'is_edited')::boolean, false),
+            seg.value->>'original_text'
+        FROM transcriptions t
+        CROSS JOIN LATERAL json_array_elements(t.segments) WITH ORDINALITY AS seg(value, idx)
+        WHERE t.segments IS NOT NULL
+    """)
+    
+    op.drop_column('transcriptions', 'segments')
+
+
+def downgrade() -> None:
+    op.add_column('transcriptions', sa.Column('segments', sa.JSON(), nullable=True))
+    
+    op.execute("""
+        UPDATE transcriptions t
+        SET segments = s.segments
+        FROM (
+            SELECT
+                transcription_id,
+                json_agg(json_build_object(
+                    'id', segment_index,
+                    'start', start_time,
+                    'end', end_time,
+                    'text', text,
+                    'speaker', speaker,
+                    'speaker_confidence', speaker_confidence,
+                    'is_edited', is_edited,
+                    'original_text', original_text
+                ) ORDER BY segment_index) AS segments
+            FROM transcription_segments
+            GROUP BY transcription_id
+        ) s
+        WHERE s.transcription_id = t.id
+    """)
+    op.execute("DELETE FROM transcription_segments")
+    
+    op.drop_index(
+        'ix_transcription_segments_transcription_id_segment_index',
+        table_name='transcription_segments'
+    )
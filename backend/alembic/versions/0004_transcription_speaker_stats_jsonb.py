@@ -0,0 +1,36 @@
+"""Store transcription speaker_stats as JSONB
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-15 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.alter_column(
+        'transcriptions', 'speaker_stats',
+        type_=postgresql.JSONB(astext_type=sa.Text()),
+        existing_type=sa.JSON(),
+        existing_nullable=True,
+        postgresql_using='speaker_stats::jsonb'
+    )
+
+
+def downgrade() -> None:
+    op.alter_column(
+        'transcriptions', 'speaker_stats',
+        type_=sa.JSON(),
+        existing_type=postgresql.JSONB(astext_type=sa.Text()),
+        existing_nullable=True,
+        postgresql_using='speaker_stats::json'
+    )
@@ -0,0 +1,37 @@
+"""cascade cluster result children on delete
+
+Revision ID: 34e26c4f3f05
+Revises: fb6974aa4369
+Create Date: 2025-08-20 10:12:31.118204
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '34e26c4f3f05'
+down_revision = 'fb6974aa4369'
+branch_labels = None
+depends_on = None
+
+
+_CHILD_TABLES = ('cluster_assignments', 'cluster_representatives')
+
+
+def upgrade() -> None:
+    for table in _CHILD_TABLES:
+        constraint = f'{table}_cluster_result_id_fkey'
+        op.drop_constraint(constraint, table, type_='foreignkey')
+        op.create_foreign_key(
+            constraint, table, 'cluster_results',
+            ['cluster_result_id'], ['id'], ondelete='CASCADE'
+        )
+
+
+def downgrade() -> None:
+    for table in _CHILD_TABLES:
+        constraint = f'{table}_cluster_result_id_fkey'
+        op.drop_constraint(constraint, table, type_='foreignkey')
+        op.create_foreign_key(
+            constraint, table, 'cluster_results',
+            ['cluster_result_id'], ['id']
+        )
@@ -0,0 +1,33 @@
+"""server side uuid defaults
+
+Revision ID: 4f8d2c6a1e90
+Revises: e2a7c91f5b38
+Create Date: 2025-08-26 09:12:44.257031
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '4f8d2c6a1e90'
+down_revision = 'e2a7c91f5b38'
+branch_labels = None
+depends_on = None
+
+TABLES = (
+    'success_conversation_vectors',
+    'cluster_results',
+    'cluster_assignments',
+    'cluster_representatives',
+    'anomaly_detection_results',
+)
+
+
+def upgrade() -> None:
+    # gen_random_uuid() is built in from PostgreSQL 13
+    for table in TABLES:
+        op.execute(f'ALTER TABLE {table} ALTER COLUMN id SET DEFAULT gen_random_uuid()')
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        op.execute(f'ALTER TABLE {table} ALTER COLUMN id DROP DEFAULT')
@@ -0,0 +1,29 @@
+"""store embeddings as halfvec
+
+Revision ID: 5cc5144a889d
+Revises: 34e26c4f3f05
+Create Date: 2025-08-21 09:41:07.552310
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '5cc5144a889d'
+down_revision = '34e26c4f3f05'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # halfvec requires pgvector >= 0.7.0
+    op.execute(
+        'ALTER TABLE success_conversation_vectors '
+        'ALTER COLUMN embedding TYPE halfvec(1536) USING embedding::halfvec(1536)'
+    )
+
+
+def downgrade() -> None:
+    op.execute(
+        'ALTER TABLE success_conversation_vectors '
+        'ALTER COLUMN embedding TYPE vector(1536) USING embedding::vector(1536)'
+    )
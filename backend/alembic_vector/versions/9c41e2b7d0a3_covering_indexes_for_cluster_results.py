@@ -0,0 +1,42 @@
+"""covering indexes for cluster results
+
+Revision ID: 9c41e2b7d0a3
+Revises: d53bf24d7ae9
+Create Date: 2025-08-25 14:02:41.118204
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '9c41e2b7d0a3'
+down_revision = 'd53bf24d7ae9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # INCLUDE columns let per-result scans run as index-only scans
+    op.create_index(
+        'ix_cluster_assignments_cluster_result_cover',
+        'cluster_assignments',
+        ['cluster_result_id'],
+        postgresql_include=['cluster_label', 'distance_to_centroid']
+    )
+    op.create_index(
+        'ix_cluster_representatives_cluster_result_cover',
+        'cluster_representatives',
+        ['cluster_result_id'],
+        postgresql_include=['cluster_label', 'quality_score', 'is_primary']
+    )
+    op.create_index(
+        'ix_anomaly_detection_results_vector_cover',
+        'anomaly_detection_results',
+        ['vector_id'],
+        postgresql_include=['anomaly_score', 'is_anomaly']
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_anomaly_detection_results_vector_cover', table_name='anomaly_detection_results')
+    op.drop_index('ix_cluster_representatives_cluster_result_cover', table_name='cluster_representatives')
+    op.drop_index('ix_cluster_assignments_cluster_result_cover', table_name='cluster_assignments')
@@ -0,0 +1,44 @@
+"""partial hnsw and filter indexes
+
+Revision ID: d53bf24d7ae9
+Revises: 5cc5144a889d
+Create Date: 2025-08-25 11:27:16.480933
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'd53bf24d7ae9'
+down_revision = '5cc5144a889d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Cosine-distance ANN index for ORDER BY embedding <=> :vec queries;
+    # every ANN query filters on is_success, so index only those rows
+    op.execute(
+        'CREATE INDEX ix_success_conversation_vectors_embedding_hnsw '
+        'ON success_conversation_vectors USING hnsw (embedding halfvec_cosine_ops) '
+        'WHERE is_success'
+    )
+    
+    # Attribute prefilters for hybrid (filter + kNN) plans
+    op.create_index(
+        'ix_success_conversation_vectors_counselor_success',
+        'success_conversation_vectors',
+        ['counselor_name', 'is_success']
+    )
+    op.execute(
+        'CREATE INDEX ix_success_conversation_vectors_chunk_metadata '
+        'ON success_conversation_vectors USING gin (chunk_metadata jsonb_path_ops)'
+    )
+
+
+def downgrade() -> None:
+    op.execute('DROP INDEX IF EXISTS ix_success_conversation_vectors_chunk_metadata')
+    op.drop_index(
+        'ix_success_conversation_vectors_counselor_success',
+        table_name='success_conversation_vectors'
+    )
+    op.execute('DROP INDEX IF EXISTS ix_success_conversation_vectors_embedding_hnsw')
@@ -0,0 +1,25 @@
+"""add text_length to conversation vectors
+
+Revision ID: e2a7c91f5b38
+Revises: 9c41e2b7d0a3
+Create Date: 2025-08-25 17:08:23.391640
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'e2a7c91f5b38'
+down_revision = '9c41e2b7d0a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('success_conversation_vectors', sa.Column('text_length', sa.Integer(), nullable=True))
+    op.execute('UPDATE success_conversation_vectors SET text_length = char_length(chunk_text)')
+    op.alter_column('success_conversation_vectors', 'text_length', nullable=False)
+
+
+def downgrade() -> None:
+    op.drop_column('success_conversation_vectors', 'text_length')
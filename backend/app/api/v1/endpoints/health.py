@@ -2,13 +2,13 @@ from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
 from datetime import datetime
 
-from app.core.database import get_database
+from app.db.session import get_db
 from app.schemas.counseling import HealthResponse
 
 router = APIRouter()
 
 @router.get("/health", response_model=HealthResponse)
-def health_check(db: Session = Depends(get_database)):
+def health_check(db: Session = Depends(get_db)):
     """
     Health check endpoint
     """
@@ -1,15 +1,21 @@
 """
 スクリプト生成・管理API エンドポイント
 """
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from sqlalchemy import tuple_
 from sqlalchemy.orm import Session
 from pydantic import BaseModel, Field
+import asyncio
+import os
 import uuid
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from multiprocessing import get_context
 
-from app.db.session import get_db
-from app.core.database import get_vector_database as get_vector_db
+from app.core.config import settings
+from app.db.session import get_db, get_vector_db
 from app.models.script import (
     ImprovementScript, 
     ScriptUsageAnalytics,
@@ -23,6 +29,27 @@ from app.services.script_quality_analyzer import create_script_quality_analyzer
 
 router = APIRouter()
 
+# スクリプト件数のキャッシュ（ステータス別, TTL付き）
+SCRIPT_COUNT_CACHE_TTL = 30  # 秒
+_script_count_cache: Dict[Optional[str], Tuple[float, int]] = {}
+
+
+def _count_scripts(query, status: Optional[str]) -> int:
+    """スクリプト件数を取得（COUNT(*)の結果を短時間キャッシュ）"""
+    now = time.monotonic()
+    cached = _script_count_cache.get(status)
+    if cached and now - cached[0] < SCRIPT_COUNT_CACHE_TTL:
+        return cached[1]
+    
+    total = query.count()
+    _script_count_cache[status] = (now, total)
+    return total
+
+
+def _invalidate_script_counts():
+    """スクリプトの作成・削除・ステータス変更時に件数キャッシュを破棄する"""
+    _script_count_cache.clear()
+
 
 # Pydanticモデル
 class ScriptGenerationRequest(BaseModel):
@@ -78,6 +105,7 @@ async def generate_script(
         
         db.add(improvement_script)
         db.commit()
+        _invalidate_script_counts()
         
         # バックグラウンドで生成処理を実行
         background_tasks.add_task(
@@ -104,9 +132,7 @@ async def get_generation_status(
 ):
     """スクリプト生成状況確認"""
     try:
-        script = db.query(ImprovementScript).filter(
-            ImprovementScript.id == job_id
-        ).first()
+        script = db.get(ImprovementScript, job_id)
         
         if not script:
             raise HTTPException(status_code=404, detail="スクリプトが見つかりません")
@@ -144,21 +170,41 @@ async def get_generation_status(
 async def get_scripts(
     limit: int = 10,
     offset: int = 0,
+    cursor: Optional[datetime] = None,
+    cursor_id: Optional[uuid.UUID] = None,
     status: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
-    """スクリプト一覧取得"""
+    """
+    スクリプト一覧取得
+    
+    cursor・cursor_id を指定した場合はキーセットページネーション（(created_at, id) < (cursor, cursor_id)）を使用し、
+    OFFSETによる読み飛ばしを行わない（作成日時が同じスクリプトもページ境界で取りこぼさない）。
+    cursor を指定しない場合は従来どおり offset を使用する（先頭ページ・ページ番号指定用）。
+    limit + 1 件取得し、次のページが存在する場合のみ next_cursor・next_cursor_id を返す
+    """
     try:
         query = db.query(ImprovementScript)
         
         if status:
             query = query.filter(ImprovementScript.status == status)
         
-        scripts = query.order_by(
-            ImprovementScript.created_at.desc()
-        ).offset(offset).limit(limit).all()
+        total = _count_scripts(query, status)
         
-        total = query.count()
+        page_query = query.order_by(ImprovementScript.created_at.desc(), ImprovementScript.id.desc())
+        if cursor is not None and cursor_id is not None:
+            page_query = page_query.filter(
+                tuple_(ImprovementScript.created_at, ImprovementScript.id) < tuple_(cursor, cursor_id)
+            )
+        elif cursor is not None:
+            page_query = page_query.filter(ImprovementScript.created_at < cursor)
+        else:
+            page_query = page_query.offset(offset)
+        
+        scripts = page_query.limit(limit + 1).all()
+        has_next = len(scripts) > limit
+        scripts = scripts[:limit]
+        last = scripts[-1] if has_next else None
         
         return {
             "scripts": [
@@ -177,7 +223,9 @@ async def get_scripts(
             ],
             "total": total,
             "limit": limit,
-            "offset": offset
+            "offset": offset,
+            "next_cursor": last.created_at if last else None,
+            "next_cursor_id": str(last.id) if last else None
         }
         
     except Exception as e:
@@ -207,9 +255,7 @@ async def get_script(
         except Exception as conn_error:
             raise HTTPException(status_code=503, detail="データベース接続エラー")
         
-        script = db.query(ImprovementScript).filter(
-            ImprovementScript.id == script_id
-        ).first()
+        script = db.get(ImprovementScript, script_id)
         
         if not script:
             raise HTTPException(status_code=404, detail="スクリプトが見つかりません")
@@ -246,9 +292,7 @@ async def update_script(
 ):
     """スクリプト更新"""
     try:
-        script = db.query(ImprovementScript).filter(
-            ImprovementScript.id == script_id
-        ).first()
+        script = db.get(ImprovementScript, script_id)
         
         if not script:
             raise HTTPException(status_code=404, detail="スクリプトが見つかりません")
@@ -260,6 +304,8 @@ async def update_script(
             setattr(script, field, value)
         
         db.commit()
+        if "status" in update_data:
+            _invalidate_script_counts()
         db.refresh(script)
         
         return {
@@ -280,9 +326,7 @@ async def activate_script(
 ):
     """スクリプト有効化"""
     try:
-        script = db.query(ImprovementScript).filter(
-            ImprovementScript.id == script_id
-        ).first()
+        script = db.get(ImprovementScript, script_id)
         
         if not script:
             raise HTTPException(status_code=404, detail="スクリプトが見つかりません")
@@ -298,6 +342,7 @@ async def activate_script(
         script.activated_at = datetime.utcnow()
         
         db.commit()
+        _invalidate_script_counts()
         
         return {
             "message": "スクリプトを有効化しました",
@@ -318,9 +363,7 @@ async def submit_feedback(
 ):
     """スクリプトフィードバック投稿"""
     try:
-        script = db.query(ImprovementScript).filter(
-            ImprovementScript.id == script_id
-        ).first()
+        script = db.get(ImprovementScript, script_id)
         
         if not script:
             raise HTTPException(status_code=404, detail="スクリプトが見つかりません")
@@ -389,9 +432,7 @@ async def get_script_analytics(
 ):
     """スクリプト分析データ取得"""
     try:
-        script = db.query(ImprovementScript).filter(
-            ImprovementScript.id == script_id
-        ).first()
+        script = db.get(ImprovementScript, script_id)
         
         if not script:
             raise HTTPException(status_code=404, detail="スクリプトが見つかりません")
@@ -458,9 +499,7 @@ async def delete_script(
 ):
     """スクリプト削除"""
     try:
-        script = db.query(ImprovementScript).filter(
-            ImprovementScript.id == script_id
-        ).first()
+        script = db.get(ImprovementScript, script_id)
         
         if not script:
             raise HTTPException(status_code=404, detail="スクリプトが見つかりません")
@@ -483,6 +522,7 @@ async def delete_script(
         
         db.delete(script)
         db.commit()
+        _invalidate_script_counts()
         
         return {
             "message": "スクリプトを削除しました",
@@ -494,6 +534,60 @@ async def delete_script(
         raise HTTPException(status_code=500, detail=f"スクリプト削除エラー: {str(e)}")
 
 
+# クラスタリング用プロセスプール（CPUバウンドな sklearn 処理をイベントループから切り離す）
+# 初回利用時に生成し、spawn で起動してAPIプロセスのイベントループ・エンジン・クライアントを引き継がない
+_cluster_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_cluster_pool() -> ProcessPoolExecutor:
+    """クラスタリング用プロセスプールを取得（未生成なら作成）"""
+    global _cluster_pool
+    if _cluster_pool is None:
+        _cluster_pool = ProcessPoolExecutor(
+            max_workers=settings.CLUSTERING_MAX_WORKERS,
+            mp_context=get_context("spawn")
+        )
+    return _cluster_pool
+
+
+def _cluster_worker_n_jobs() -> int:
+    """ワーカー内の joblib 並列数（ワーカー数 × 並列数が CPU 数を超えないようにする）"""
+    return max(1, (os.cpu_count() or 1) // settings.CLUSTERING_MAX_WORKERS)
+
+
+def _run_clustering_sync(k_max: int, n_jobs: int) -> str:
+    """
+    ワーカープロセス内でクラスタリングを実行し、結果IDのみを返す
+    前回のK-means結果以降の新規ベクトルが少ない場合は、全件の再クラスタリングではなく増分更新する
+    """
+    from app.db.session import VectorSessionLocal
+    from app.services.clustering_service import ClusteringService, FULL_KMEANS_ALGORITHMS
+    
+    vector_db = VectorSessionLocal()
+    try:
+        clustering_service = ClusteringService(vector_db, n_jobs=n_jobs)
+        base_result_id = None
+        if settings.CLUSTERING_ALGORITHM in FULL_KMEANS_ALGORITHMS:
+            base_result_id = clustering_service.find_incremental_base(
+                settings.CLUSTERING_INCREMENTAL_MAX_NEW_RATIO
+            )
+        
+        if base_result_id is not None:
+            cluster_result = asyncio.run(
+                clustering_service.update_clustering_incrementally(base_result_id)
+            )
+        else:
+            cluster_result = asyncio.run(clustering_service.perform_clustering(
+                algorithm=settings.CLUSTERING_ALGORITHM,
+                k_range=(2, k_max),
+                auto_select_k=True,
+                svd_components=settings.CLUSTERING_SVD_COMPONENTS
+            ))
+        return str(cluster_result["cluster_result_id"])
+    finally:
+        vector_db.close()
+
+
 # バックグラウンドタスク
 async def execute_script_generation(
     script_id: str,
@@ -503,18 +597,16 @@ async def execute_script_generation(
     """スクリプト生成をバックグラウンドで実行"""
     import logging
     logger = logging.getLogger(__name__)
+    script = None
     
     try:
-        import asyncio
         from datetime import datetime
         
         logger.info(f"🚀 Starting script generation for script_id: {script_id}")
         logger.info(f"📋 Request data: {request_data}")
         
-        # スクリプト開始
-        script = db.query(ImprovementScript).filter(
-            ImprovementScript.id == script_id
-        ).first()
+        # スクリプト開始（主キー検索はアイデンティティマップを優先）
+        script = db.get(ImprovementScript, script_id)
         
         if not script:
             logger.error(f"❌ Script {script_id} not found in database")
@@ -524,13 +616,13 @@ async def execute_script_generation(
         script.status = "generating"
         script.updated_at = datetime.utcnow()
         db.commit()
+        _invalidate_script_counts()
         logger.info(f"📊 Script status updated to 'generating'")
         
         # 最新データでクラスタリングを実行
         logger.info(f"🔄 Starting clustering process")
         from app.db.session import VectorSessionLocal
-        from app.models.vector import ClusterResult, SuccessConversationVector
-        from app.services.clustering_service import ClusteringService
+        from app.models.vector import SuccessConversationVector
         
         vector_db = VectorSessionLocal()
         try:
@@ -544,24 +636,21 @@ async def execute_script_generation(
                 script.status = "failed"
                 script.updated_at = datetime.utcnow()
                 db.commit()
+                _invalidate_script_counts()
                 return
             
-            # クラスタリング実行
-            logger.info(f"🎯 Starting clustering with {vector_count} vectors")
-            clustering_service = ClusteringService(vector_db)
-            cluster_result = await clustering_service.perform_clustering(
-                algorithm="kmeans",
-                k_range=(2, min(10, vector_count // 2)),
-                auto_select_k=True
-            )
-            
-            cluster_result_id = str(cluster_result["cluster_result_id"])
-            logger.info(f"✅ Clustering completed with ID: {cluster_result_id}")
-            db.commit()
-            
         finally:
             vector_db.close()
         
+        # クラスタリング実行（プロセスプールで実行し、IDのみを受け取る）
+        logger.info(f"🎯 Starting clustering with {vector_count} vectors")
+        loop = asyncio.get_running_loop()
+        cluster_result_id = await loop.run_in_executor(
+            _get_cluster_pool(), _run_clustering_sync,
+            min(10, vector_count // 2), _cluster_worker_n_jobs()
+        )
+        logger.info(f"✅ Clustering completed with ID: {cluster_result_id}")
+        
         # スクリプト生成サービス実行
         logger.info(f"🤖 Starting script generation service")
         # 新しいベクトルDBセッションを作成
@@ -593,6 +682,7 @@ async def execute_script_generation(
         
         logger.info(f"💾 Saving script to database")
         db.commit()
+        _invalidate_script_counts()
         
         # ベクトルDBセッションをクローズ
         vector_db_for_generation.close()
@@ -603,20 +693,21 @@ async def execute_script_generation(
         
         logger.info(f"🎉 Script generation completed successfully for {script_id}")
         db.commit()
+        _invalidate_script_counts()
         
     except Exception as e:
         logger.error(f"❌ Script generation failed for {script_id}: {str(e)}")
         logger.error(f"🔍 Error type: {type(e).__name__}")
         
-        # エラー処理
-        script = db.query(ImprovementScript).filter(
-            ImprovementScript.id == script_id
-        ).first()
+        # エラー処理（取得済みのオブジェクトを再利用）
+        if script is None:
+            script = db.get(ImprovementScript, script_id)
         
         if script:
             script.status = "failed"
             script.updated_at = datetime.utcnow()
             db.commit()
+            _invalidate_script_counts()
             logger.info(f"📊 Script status updated to 'failed'")
         else:
             logger.error(f"❌ Could not find script {script_id} to update failure status")
@@ -81,9 +81,7 @@ async def update_session_label(
     db: Session = Depends(get_db)
 ):
     # Find session
-    db_session = db.query(CounselingSession).filter(
-        CounselingSession.id == session_id
-    ).first()
+    db_session = db.get(CounselingSession, session_id)
     
     if not db_session:
         raise HTTPException(status_code=404, detail="Session not found")
@@ -105,9 +103,7 @@ async def get_session(
     session_id: str,
     db: Session = Depends(get_db)
 ):
-    db_session = db.query(CounselingSession).filter(
-        CounselingSession.id == session_id
-    ).first()
+    db_session = db.get(CounselingSession, session_id)
     
     if not db_session:
         raise HTTPException(status_code=404, detail="Session not found")
@@ -129,9 +125,7 @@ async def get_session_audio(
     db: Session = Depends(get_db)
 ):
     # Find session
-    db_session = db.query(CounselingSession).filter(
-        CounselingSession.id == session_id
-    ).first()
+    db_session = db.get(CounselingSession, session_id)
     
     if not db_session:
         raise HTTPException(status_code=404, detail="Session not found")
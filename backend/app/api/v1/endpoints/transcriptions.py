@@ -1,15 +1,19 @@
 from fastapi import APIRouter, HTTPException, Depends
+from sqlalchemy import func, insert, lambda_stmt, select, update
 from sqlalchemy.orm import Session
-from app.db.session import get_db
+from app.db.session import get_db, VectorSessionLocal
 from app.models.session import CounselingSession
-from app.models.transcription import Transcription
+from app.models.transcription import Transcription, TranscriptionSegment
 from app.models.vector import SuccessConversationVector
 from app.services.transcription.whisper_service import whisper_service
 from app.services.transcription.speaker_diarization import speaker_diarization_service
 from app.services.embedding_service import embedding_service
-from datetime import datetime, timezone
+from app.websocket.connection_manager import manager
 import asyncio
 import logging
+import time
+import uuid
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
@@ -32,103 +36,95 @@ async def vectorize_transcription(
     logger.info(f"   - Is Success: {is_success}")
     logger.info(f"   - Segments count: {len(segments)}")
     
-    vector_db = None
-    try:
-        # Get vector database session
-        from app.db.session import VectorSessionLocal
-        vector_db = VectorSessionLocal()
-        logger.info(f"📊 Connected to vector database for session {session_id}")
+    # Sessions come from the pooled vector engine; closing returns the connection to the pool
+    with VectorSessionLocal() as vector_db:
+        try:
+            logger.info(f"📊 Connected to vector database for session {session_id}")
         
-        # Check if vectors already exist for this session
-        existing_vectors = vector_db.query(SuccessConversationVector).filter(
-            SuccessConversationVector.session_id == session_id
-        ).first()
+            # Check if vectors already exist for this session
+            existing_vectors = vector_db.query(SuccessConversationVector).filter(
+                SuccessConversationVector.session_id == session_id
+            ).first()
         
-        if existing_vectors:
-            logger.info(f"⚠️  Vectors already exist for session {session_id}, skipping vectorization")
-            return
+            if existing_vectors:
+                logger.info(f"⚠️  Vectors already exist for session {session_id}, skipping vectorization")
+                return
         
-        # Prepare conversation text with speaker information
-        conversation_chunks = []
-        current_chunk = []
-        current_tokens = 0
+            # Prepare conversation text with speaker information
+            conversation_chunks = []
+            current_chunk = []
+            current_tokens = 0
         
-        for segment in segments:
-            speaker = segment.get("speaker", "unknown")
-            text = segment.get("text", "").strip()
-            
-            if not text:
-                continue
-                
             # Format: "Speaker: text"
-            formatted_segment = f"{speaker}: {text}"
-            segment_tokens = embedding_service.count_tokens(formatted_segment)
-            
-            # Check if adding this segment would exceed max tokens
-            if current_tokens + segment_tokens > embedding_service.max_tokens and current_chunk:
-                # Save current chunk
+            formatted_segments = [
+                f"{segment.get('speaker', 'unknown')}: {segment.get('text', '').strip()}"
+                for segment in segments
+                if segment.get("text", "").strip()
+            ]
+            # Tokenize every segment in one encode_batch call
+            segment_token_counts = embedding_service.count_tokens_batch(formatted_segments)
+        
+            for formatted_segment, segment_tokens in zip(formatted_segments, segment_token_counts):
+                # Check if adding this segment would exceed max tokens
+                if current_tokens + segment_tokens > embedding_service.max_tokens and current_chunk:
+                    # Save current chunk
+                    conversation_chunks.append("\n".join(current_chunk))
+                    current_chunk = [formatted_segment]
+                    current_tokens = segment_tokens
+                else:
+                    current_chunk.append(formatted_segment)
+                    current_tokens += segment_tokens
+        
+            # Add the last chunk
+            if current_chunk:
                 conversation_chunks.append("\n".join(current_chunk))
-                current_chunk = [formatted_segment]
-                current_tokens = segment_tokens
-            else:
-                current_chunk.append(formatted_segment)
-                current_tokens += segment_tokens
         
-        # Add the last chunk
-        if current_chunk:
-            conversation_chunks.append("\n".join(current_chunk))
+            # Generate embeddings for each chunk
+            logger.info(f"Generating embeddings for {len(conversation_chunks)} chunks from session {session_id}")
         
-        # Generate embeddings for each chunk
-        logger.info(f"Generating embeddings for {len(conversation_chunks)} chunks from session {session_id}")
+            # All chunks are embedded in concurrent API batches sorted by token count;
+            # rows of the returned matrix follow conversation_chunks order
+            chunk_token_counts = embedding_service.count_tokens_batch(conversation_chunks)
+            embeddings = await embedding_service.embed_texts(conversation_chunks, chunk_token_counts)
         
-        for i, chunk_text in enumerate(conversation_chunks):
-            try:
-                logger.info(f"Processing chunk {i+1}/{len(conversation_chunks)} for session {session_id}")
-                logger.info(f"Chunk text preview: {chunk_text[:100]}...")
-                
-                # Generate embedding
-                embedding = await embedding_service.embed_text(chunk_text)
-                logger.info(f"Generated embedding vector of dimension {len(embedding)} for chunk {i}")
+            vector_rows = []
+            for i, (chunk_text, embedding, chunk_tokens) in enumerate(
+                zip(conversation_chunks, embeddings, chunk_token_counts)
+            ):
+                # Chunks that failed even after the per-chunk fallback come back as NaN rows
+                if np.isnan(embedding[0]):
+                    logger.error(f"Failed to vectorize chunk {i} for session {session_id}")
+                    continue
                 
-                # Create vector record
-                vector_record = SuccessConversationVector(
-                    session_id=session_id,
-                    chunk_index=i,
-                    chunk_text=chunk_text,
-                    embedding=embedding,
-                    counselor_name=counselor_name,
-                    is_success=is_success if is_success is not None else False,
-                    session_metadata={
+                vector_rows.append({
+                    "session_id": session_id,
+                    "chunk_index": i,
+                    "chunk_text": chunk_text,
+                    "embedding": embedding,
+                    "counselor_name": counselor_name,
+                    "is_success": is_success if is_success is not None else False,
+                    "session_metadata": {
                         "chunk_number": i + 1,
                         "total_chunks": len(conversation_chunks),
-                        "chunk_tokens": embedding_service.count_tokens(chunk_text)
+                        "chunk_tokens": chunk_tokens
                     }
-                )
-                
-                vector_db.add(vector_record)
-                logger.info(f"Added vector record to database for chunk {i}")
-                
-            except Exception as chunk_error:
-                logger.error(f"Failed to vectorize chunk {i} for session {session_id}: {chunk_error}")
-                continue
+                })
         
-        # Commit all vectors
-        vector_db.commit()
-        logger.info(f"✅ Successfully committed {len(conversation_chunks)} vectors to database for session {session_id}")
+            # Insert all vectors in one batched INSERT and commit once
+            if vector_rows:
+                vector_db.execute(insert(SuccessConversationVector), vector_rows)
+            vector_db.commit()
+            logger.info(f"✅ Successfully committed {len(vector_rows)} of {len(conversation_chunks)} vectors to database for session {session_id}")
         
-        # Verify the data was saved
-        saved_vectors = vector_db.query(SuccessConversationVector).filter(
-            SuccessConversationVector.session_id == session_id
-        ).count()
-        logger.info(f"✅ Verification: {saved_vectors} vectors found in database for session {session_id}")
+            # Verify the data was saved
+            saved_vectors = vector_db.query(SuccessConversationVector).filter(
+                SuccessConversationVector.session_id == session_id
+            ).count()
+            logger.info(f"✅ Verification: {saved_vectors} vectors found in database for session {session_id}")
         
-    except Exception as e:
-        logger.error(f"Vectorization failed for session {session_id}: {str(e)}")
-        if vector_db:
+        except Exception as e:
+            logger.error(f"Vectorization failed for session {session_id}: {str(e)}")
             vector_db.rollback()
-    finally:
-        if vector_db:
-            vector_db.close()
 
 @router.post("/{session_id}/start")
 async def start_transcription(
@@ -141,9 +137,7 @@ async def start_transcription(
     logger.info(f"🎯 Transcription API called for session {session_id}")
     
     # Check if session exists
-    session = db.query(CounselingSession).filter(
-        CounselingSession.id == session_id
-    ).first()
+    session = db.get(CounselingSession, session_id)
     
     if not session:
         logger.error(f"❌ Session {session_id} not found in database")
@@ -164,43 +158,70 @@ async def start_transcription(
         db.commit()
         
         # Process transcription directly (synchronous)
-        start_time = datetime.now(timezone.utc)
+        start_time = time.monotonic()
         
-        # Get audio file from S3 and process
-        transcription_result = whisper_service.transcribe_audio(
+        # Get audio file from S3 and process off the event loop so websocket
+        # progress updates and other requests keep flowing
+        await manager.send_progress_update(session_id, 10, "transcribing", "Transcribing audio")
+        transcription_result = await whisper_service.transcribe_async(
             session.file_url,
             session_id
         )
         
         # Perform speaker diarization
+        await manager.send_progress_update(session_id, 70, "diarization", "Assigning speakers")
         try:
             enhanced_segments = speaker_diarization_service.assign_speakers(
                 transcription_result["segments"]
             )
             # Calculate speaker statistics
             speaker_stats = speaker_diarization_service.get_speaker_statistics(enhanced_segments)
-        except Exception as speaker_error:
-            print(f"Speaker diarization error: {speaker_error}")
-            print(f"Segments data: {transcription_result['segments']}")
+        except Exception:
+            # Traceback goes to the log; the (potentially huge) segment list is not dumped
+            logger.exception(
+                f"Speaker diarization failed for session {session_id} "
+                f"({len(transcription_result['segments'])} segments)"
+            )
             # Use original segments without speaker assignment
             enhanced_segments = transcription_result["segments"]
             speaker_stats = {}
         
-        # Create transcription record
-        transcription = Transcription(
+        # Insert the transcription with a Core INSERT: the segment list can be
+        # large and doesn't need ORM instrumentation or change tracking
+        transcription_id = str(uuid.uuid4())
+        db.execute(Transcription.__table__.insert().values(
+            id=transcription_id,
             session_id=session_id,
             full_text=transcription_result["full_text"],
             language=transcription_result["language"],
             duration=transcription_result["duration"],
-            segments=enhanced_segments,
             speaker_stats=speaker_stats,
-            processing_time=(datetime.now(timezone.utc) - start_time).total_seconds(),
+            processing_time=time.monotonic() - start_time,
             status="completed"
-        )
+        ))
         
-        db.add(transcription)
+        # Segments are stored one row each with a single executemany
+        if enhanced_segments:
+            db.execute(
+                TranscriptionSegment.__table__.insert(),
+                [
+                    {
+                        "id": str(uuid.uuid4()),
+                        "transcription_id": transcription_id,
+                        "segment_index": index,
+                        "start_time": segment.get("start", 0),
+                        "end_time": segment.get("end", 0),
+                        "text": segment.get("text", ""),
+                        "speaker": segment.get("speaker"),
+                        "speaker_confidence": segment.get("speaker_confidence"),
+                        "is_edited": False
+                    }
+                    for index, segment in enumerate(enhanced_segments)
+                ]
+            )
         session.transcription_status = "completed"
         db.commit()
+        await manager.send_progress_update(session_id, 100, "completed", "Transcription completed")
         
         logger.info(f"✅ Transcription completed and saved for session {session_id}")
         logger.info(f"🔍 Checking if session should be vectorized - is_success: {session.is_success}")
@@ -228,21 +249,55 @@ async def start_transcription(
         
         return {
             "message": "Transcription completed",
-            "transcription_id": transcription.id,
+            "transcription_id": transcription_id,
             "session_id": session_id,
             "status": "completed"
         }
         
     except Exception as e:
         # Handle errors
+        logger.exception(f"Transcription failed for session {session_id}")
         session.transcription_status = "failed"
         db.commit()
+        await manager.send_error_notification(session_id, str(e), "transcription_failed")
         
         raise HTTPException(
             status_code=500,
             detail=f"Transcription failed: {str(e)}"
         )
 
+def _segment_to_dict(segment: TranscriptionSegment) -> dict:
+    """
+    Shape a segment row like the segment dicts produced by Whisper/diarization
+    """
+    return {
+        "id": segment.segment_index,
+        "start": segment.start_time,
+        "end": segment.end_time,
+        "text": segment.text,
+        "speaker": segment.speaker,
+        "speaker_confidence": segment.speaker_confidence,
+        "is_edited": segment.is_edited,
+        "original_text": segment.original_text
+    }
+
+def _get_session_with_transcription(db: Session, session_id: str):
+    """
+    Fetch a session and its transcription (if any) in a single round-trip
+    Returns (None, None) when the session does not exist
+    """
+    # lambda_stmt caches the compiled SELECT; only session_id is bound per call
+    # (the status endpoint is polled while a transcription runs)
+    stmt = lambda_stmt(lambda: select(CounselingSession, Transcription).outerjoin(
+        Transcription, Transcription.session_id == CounselingSession.id
+    ))
+    stmt += lambda s: s.where(CounselingSession.id == session_id)
+    row = db.execute(stmt).first()
+    
+    if row is None:
+        return None, None
+    return row
+
 @router.get("/{session_id}/status")
 async def get_transcription_status(
     session_id: str,
@@ -251,17 +306,11 @@ async def get_transcription_status(
     """
     Get transcription status for a session
     """
-    session = db.query(CounselingSession).filter(
-        CounselingSession.id == session_id
-    ).first()
+    session, transcription = _get_session_with_transcription(db, session_id)
     
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    transcription = db.query(Transcription).filter(
-        Transcription.session_id == session_id
-    ).first()
-    
     response = {
         "session_id": session_id,
         "status": session.transcription_status,
@@ -286,17 +335,11 @@ async def get_transcription(
     """
     Get transcription data for a session
     """
-    session = db.query(CounselingSession).filter(
-        CounselingSession.id == session_id
-    ).first()
+    session, transcription = _get_session_with_transcription(db, session_id)
     
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    transcription = db.query(Transcription).filter(
-        Transcription.session_id == session_id
-    ).first()
-    
     if not transcription:
         raise HTTPException(status_code=404, detail="Transcription not found")
     
@@ -306,13 +349,20 @@ async def get_transcription(
             detail=f"Transcription not completed. Current status: {transcription.status}"
         )
     
+    transcription_id = transcription.id
+    segments = db.execute(lambda_stmt(
+        lambda: select(TranscriptionSegment)
+        .where(TranscriptionSegment.transcription_id == transcription_id)
+        .order_by(TranscriptionSegment.segment_index)
+    )).scalars().all()
+    
     return {
         "transcription_id": transcription.id,
         "session_id": session_id,
         "full_text": transcription.full_text,
         "language": transcription.language,
         "duration": transcription.duration,
-        "segments": transcription.segments,
+        "segments": [_segment_to_dict(segment) for segment in segments],
         "speaker_stats": transcription.speaker_stats,
         "processing_time": transcription.processing_time,
         "created_at": transcription.created_at,
@@ -329,25 +379,27 @@ async def update_transcription_segment(
     """
     Update a specific transcription segment
     """
-    transcription = db.query(Transcription).filter(
-        Transcription.id == transcription_id
-    ).first()
-    
-    if not transcription:
-        raise HTTPException(status_code=404, detail="Transcription not found")
+    # Single-row UPDATE; the first edit keeps the Whisper text in original_text
+    result = db.execute(
+        update(TranscriptionSegment)
+        .where(
+            TranscriptionSegment.transcription_id == transcription_id,
+            TranscriptionSegment.segment_index == segment_index
+        )
+        .values(
+            original_text=func.coalesce(TranscriptionSegment.original_text, TranscriptionSegment.text),
+            text=new_text,
+            is_edited=True
+        )
+        .execution_options(synchronize_session=False)
+    )
     
-    if not transcription.segments or segment_index >= len(transcription.segments):
+    if result.rowcount == 0:
+        db.rollback()
+        if not db.get(Transcription, transcription_id):
+            raise HTTPException(status_code=404, detail="Transcription not found")
         raise HTTPException(status_code=404, detail="Segment not found")
     
-    # Update the segment
-    segments = transcription.segments.copy()
-    if "original_text" not in segments[segment_index]:
-        segments[segment_index]["original_text"] = segments[segment_index]["text"]
-    
-    segments[segment_index]["text"] = new_text
-    segments[segment_index]["is_edited"] = True
-    
-    transcription.segments = segments
     db.commit()
     
     return {"message": "Segment updated successfully"}
@@ -1,31 +1,37 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 from app.websocket.connection_manager import manager
+from starlette import status
 import logging
-import json
+import re
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+SESSION_ID_PATTERN = re.compile(
+    r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}", re.IGNORECASE
+)
+
 @router.websocket("/ws/{session_id}")
 async def websocket_endpoint(websocket: WebSocket, session_id: str):
+    # Session ids are UUIDs; anything else is rejected before the handshake
+    if not SESSION_ID_PATTERN.fullmatch(session_id):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    
     await manager.connect(websocket, session_id)
     try:
-        # Send initial connection confirmation
-        await websocket.send_text(json.dumps({
-            "type": "connection",
-            "session_id": session_id,
-            "status": "connected",
-            "message": f"WebSocket connected for session {session_id}"
-        }))
+        # Send initial connection confirmation; a validated UUID needs no JSON escaping
+        await websocket.send_bytes((
+            f'{{"type":"connection","session_id":"{session_id}","status":"connected",'
+            f'"message":"WebSocket connected for session {session_id}"}}'
+        ).encode("utf-8"))
         
+        # Keepalive is handled by protocol-level ping/pong (uvicorn --ws-ping-*),
+        # so client frames are only drained until the socket closes
         while True:
-            data = await websocket.receive_text()
-            # Echo back for heartbeat/keepalive
-            await websocket.send_text(json.dumps({
-                "type": "heartbeat",
-                "session_id": session_id,
-                "status": "connected"
-            }))
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
     except WebSocketDisconnect:
         manager.disconnect(websocket, session_id)
         logger.info(f"WebSocket disconnected for session {session_id}")
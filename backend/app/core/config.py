@@ -1,4 +1,4 @@
-from pydantic_settings import BaseSettings
+from pydantic_settings import BaseSettings, SettingsConfigDict
 from typing import Optional
 
 class Settings(BaseSettings):
@@ -42,12 +42,20 @@ class Settings(BaseSettings):
     # Clustering Settings
     MIN_CLUSTER_SIZE: int = 5
     MAX_CLUSTERS: int = 15
+    CLUSTERING_MAX_WORKERS: int = 2  # クラスタリング用プロセスプールのワーカー数
+    CLUSTERING_ALGORITHM: str = "kmeans"  # スクリプト生成時のクラスタリング手法（'kmeans' or 'kmeans_faiss'）
+    CLUSTERING_INCREMENTAL_MAX_NEW_RATIO: float = 0.2  # 直近の全件K-means以降の新規ベクトル比率がこれ以下なら増分更新する（0で常に全件）
+    CLUSTERING_SVD_COMPONENTS: Optional[int] = None  # K-means前にTruncated SVDで射影する次元数（Noneで射影しない）
     
     # Redis (for caching)
     REDIS_URL: str = "redis://localhost:6379"
+    EMBEDDING_CACHE_ENABLED: bool = False  # 埋め込みベクトルをRedisにキャッシュする
     
-    class Config:
-        env_file = ".env"
-        extra = "ignore"  # 未定義フィールドを無視
+    model_config = SettingsConfigDict(
+        env_file=".env",
+        extra="ignore",  # 未定義フィールドを無視
+        case_sensitive=False
+    )
+
 
 settings = Settings()
\ No newline at end of file
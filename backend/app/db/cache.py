@@ -0,0 +1,20 @@
+import redis
+from typing import Optional
+from app.core.config import settings
+
+# Redis connection pool shared by every cache user in the process
+REDIS_MAX_CONNECTIONS = 20
+_redis_pool: Optional[redis.ConnectionPool] = None
+
+
+def get_redis_pool() -> redis.ConnectionPool:
+    """Get the shared Redis connection pool (created on first use)"""
+    global _redis_pool
+    if _redis_pool is None:
+        _redis_pool = redis.ConnectionPool.from_url(
+            settings.REDIS_URL,
+            decode_responses=True,
+            max_connections=REDIS_MAX_CONNECTIONS,
+            socket_keepalive=True
+        )
+    return _redis_pool
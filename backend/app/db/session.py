@@ -1,3 +1,4 @@
+import orjson
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
@@ -5,28 +6,40 @@ from app.core.config import settings
 # Main database engine (RDS)
 engine = create_engine(
     settings.DATABASE_URL,
+    pool_size=20,
+    max_overflow=40,
     pool_timeout=20,
     pool_recycle=1800,
     pool_pre_ping=True,
+    echo=settings.DEBUG,
+    # JSON columns (speaker stats, script content) are encoded with orjson
+    json_serializer=lambda obj: orjson.dumps(obj).decode(),
+    json_deserializer=orjson.loads,
     connect_args={
         "connect_timeout": 10,
         "application_name": "counseling_support_api"
     }
 )
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
 
 # Vector database engine (Aurora)
 vector_engine = create_engine(
     settings.VECTOR_DATABASE_URL if settings.VECTOR_DATABASE_URL else settings.DATABASE_URL,
+    pool_size=10,
+    max_overflow=20,
     pool_timeout=20,
     pool_recycle=1800,
-    pool_pre_ping=True,
+    pool_pre_ping=False,  # pool_recycle retires stale connections; skip the per-checkout ping
+    echo=settings.DEBUG,
+    # Bulk vector inserts are sent as multi-row VALUES pages
+    executemany_mode="values_plus_batch",
+    insertmanyvalues_page_size=1000,
     connect_args={
         "connect_timeout": 10,
         "application_name": "counseling_support_vector"
     }
 )
-VectorSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=vector_engine)
+VectorSessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=vector_engine)
 
 def get_db():
     """Get main database session"""
@@ -42,4 +55,13 @@ def get_vector_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def create_tables():
+    """Create all tables in both databases"""
+    from app.db.base import Base
+    from app.db.base_class import VectorBase
+    import app.models.vector  # noqa: F401 - register vector models
+
+    Base.metadata.create_all(bind=engine)
+    VectorBase.metadata.create_all(bind=vector_engine)
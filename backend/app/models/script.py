@@ -1,7 +1,7 @@
 """
 スクリプト管理用データベースモデル
 """
-from sqlalchemy import Column, Text, DateTime, UUID, Float, Boolean, Integer, ForeignKey
+from sqlalchemy import Column, Text, DateTime, UUID, Float, Boolean, Integer, ForeignKey, Index
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 import uuid
@@ -13,6 +13,10 @@ from app.db.base_class import Base
 class ImprovementScript(Base):
     """改善スクリプト"""
     __tablename__ = "improvement_scripts"
+    __table_args__ = (
+        # 一覧のキーセットページネーション（ORDER BY created_at DESC, id DESC）用
+        Index("ix_improvement_scripts_created_at_id", "created_at", "id"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     version = Column(Text, nullable=False)  # e.g., "v1.0.0", "v1.1.0"
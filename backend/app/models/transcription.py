@@ -1,4 +1,5 @@
-from sqlalchemy import Column, String, Integer, Float, Boolean, DateTime, Text, JSON, ForeignKey
+from sqlalchemy import Column, String, Integer, Float, Boolean, DateTime, Text, ForeignKey, Index
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.db.base_class import Base
@@ -21,11 +22,10 @@ class Transcription(Base):
     status = Column(String(20), default="pending")
     # pending, processing, completed, failed
     
-    # Segments with timestamps and speaker information
-    segments = Column(JSON, nullable=True)
+    # Segments with timestamps and speaker information live in transcription_segments
     
     # Speaker statistics
-    speaker_stats = Column(JSON, nullable=True)
+    speaker_stats = Column(JSONB, nullable=True)
     
     # Processing metadata
     processing_time = Column(Float, nullable=True)  # seconds
@@ -40,6 +40,13 @@ class Transcription(Base):
 
 class TranscriptionSegment(Base):
     __tablename__ = "transcription_segments"
+    __table_args__ = (
+        Index(
+            "ix_transcription_segments_transcription_id_segment_index",
+            "transcription_id", "segment_index",
+            unique=True
+        ),
+    )
     
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     transcription_id = Column(String(36), ForeignKey("transcriptions.id"), nullable=False)
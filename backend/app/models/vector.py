@@ -1,24 +1,67 @@
 """
 ベクトルデータベースモデル
 """
-from sqlalchemy import Column, Text, DateTime, UUID, ForeignKey, Integer, Float, Boolean
+from sqlalchemy import Column, Text, DateTime, UUID, ForeignKey, Integer, Float, Boolean, Index, text
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
-from pgvector.sqlalchemy import Vector
-import uuid
+from sqlalchemy.types import TypeDecorator
+from pgvector.sqlalchemy import HALFVEC
+import numpy as np
 from datetime import datetime
 
 from app.db.base_class import VectorBase
 
 
+class Float16Vector(TypeDecorator):
+    """
+    halfvec として保存するベクトル型
+    書き込み時に float16 へ量子化し、読み出し時は計算用に float32 の ndarray を返す
+    """
+    impl = HALFVEC
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return np.asarray(value, dtype=np.float16)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return value.to_numpy().astype(np.float32)
+
+
+def _chunk_text_length(context) -> int:
+    """挿入時に chunk_text の文字数を text_length へ設定する"""
+    return len(context.get_current_parameters()["chunk_text"])
+
+
 class SuccessConversationVector(VectorBase):
     """成功会話のベクトル化データ"""
     __tablename__ = "success_conversation_vectors"
-
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    __table_args__ = (
+        # ANN検索は常に is_success で絞り込むため部分インデックスにする
+        Index(
+            "ix_success_conversation_vectors_embedding_hnsw",
+            "embedding",
+            postgresql_using="hnsw",
+            postgresql_ops={"embedding": "halfvec_cosine_ops"},
+            postgresql_where=text("is_success")
+        ),
+        Index("ix_success_conversation_vectors_counselor_success", "counselor_name", "is_success"),
+        Index(
+            "ix_success_conversation_vectors_chunk_metadata",
+            "chunk_metadata",
+            postgresql_using="gin",
+            postgresql_ops={"chunk_metadata": "jsonb_path_ops"}
+        ),
+    )
+
+    id = Column(UUID(as_uuid=True), primary_key=True, server_default=text("gen_random_uuid()"))
     session_id = Column(Text, nullable=False)  # Remove foreign key constraint
     chunk_text = Column(Text, nullable=False)
-    embedding = Column(Vector(1536), nullable=False)  # OpenAI text-embedding-3-small の次元数
+    text_length = Column(Integer, nullable=False, default=_chunk_text_length)  # chunk_text の文字数
+    embedding = Column(Float16Vector(1536), nullable=False)  # OpenAI text-embedding-3-small の次元数
     chunk_metadata = Column(JSONB, nullable=True)
     chunk_index = Column(Integer, nullable=False, default=0)
     counselor_name = Column(Text, nullable=True)
@@ -33,25 +76,39 @@ class ClusterResult(VectorBase):
     """クラスタリング結果"""
     __tablename__ = "cluster_results"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    algorithm = Column(Text, nullable=False)  # 'kmeans' or 'hdbscan'
+    id = Column(UUID(as_uuid=True), primary_key=True, server_default=text("gen_random_uuid()"))
+    algorithm = Column(Text, nullable=False)  # 'kmeans', 'kmeans_faiss', 'kmeans_incremental' or 'hdbscan'
     cluster_count = Column(Integer, nullable=False)
     parameters = Column(JSONB, nullable=True)
     silhouette_score = Column(Float, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
-    # リレーション
-    cluster_assignments = relationship("ClusterAssignment", back_populates="cluster_result")
-    representatives = relationship("ClusterRepresentative", back_populates="cluster_result")
+    # リレーション（子行の削除はDB側の ON DELETE CASCADE に任せる）
+    cluster_assignments = relationship(
+        "ClusterAssignment", back_populates="cluster_result",
+        cascade="all, delete-orphan", passive_deletes=True
+    )
+    representatives = relationship(
+        "ClusterRepresentative", back_populates="cluster_result",
+        cascade="all, delete-orphan", passive_deletes=True
+    )
 
 
 class ClusterAssignment(VectorBase):
     """ベクトルのクラスタ割り当て"""
     __tablename__ = "cluster_assignments"
-
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    __table_args__ = (
+        # cluster_result_id での走査をインデックスオンリースキャンで完結させる
+        Index(
+            "ix_cluster_assignments_cluster_result_cover",
+            "cluster_result_id",
+            postgresql_include=["cluster_label", "distance_to_centroid"]
+        ),
+    )
+
+    id = Column(UUID(as_uuid=True), primary_key=True, server_default=text("gen_random_uuid()"))
     vector_id = Column(UUID(as_uuid=True), ForeignKey("success_conversation_vectors.id"), nullable=False)
-    cluster_result_id = Column(UUID(as_uuid=True), ForeignKey("cluster_results.id"), nullable=False)
+    cluster_result_id = Column(UUID(as_uuid=True), ForeignKey("cluster_results.id", ondelete="CASCADE"), nullable=False)
     cluster_label = Column(Integer, nullable=False)
     distance_to_centroid = Column(Float, nullable=True)
 
@@ -63,9 +120,16 @@ class ClusterAssignment(VectorBase):
 class ClusterRepresentative(VectorBase):
     """クラスタ代表例"""
     __tablename__ = "cluster_representatives"
-
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    cluster_result_id = Column(UUID(as_uuid=True), ForeignKey("cluster_results.id"), nullable=False)
+    __table_args__ = (
+        Index(
+            "ix_cluster_representatives_cluster_result_cover",
+            "cluster_result_id",
+            postgresql_include=["cluster_label", "quality_score", "is_primary"]
+        ),
+    )
+
+    id = Column(UUID(as_uuid=True), primary_key=True, server_default=text("gen_random_uuid()"))
+    cluster_result_id = Column(UUID(as_uuid=True), ForeignKey("cluster_results.id", ondelete="CASCADE"), nullable=False)
     vector_id = Column(UUID(as_uuid=True), ForeignKey("success_conversation_vectors.id"), nullable=False)
     cluster_label = Column(Integer, nullable=False)
     quality_score = Column(Float, nullable=False)
@@ -81,8 +145,16 @@ class ClusterRepresentative(VectorBase):
 class AnomalyDetectionResult(VectorBase):
     """異常検出結果"""
     __tablename__ = "anomaly_detection_results"
-
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    __table_args__ = (
+        # cluster_result_id を持たないため vector_id 起点でスコアを引けるようにする
+        Index(
+            "ix_anomaly_detection_results_vector_cover",
+            "vector_id",
+            postgresql_include=["anomaly_score", "is_anomaly"]
+        ),
+    )
+
+    id = Column(UUID(as_uuid=True), primary_key=True, server_default=text("gen_random_uuid()"))
     vector_id = Column(UUID(as_uuid=True), ForeignKey("success_conversation_vectors.id"), nullable=False)
     algorithm = Column(Text, nullable=False)  # 'isolation_forest' or 'lof'
     anomaly_score = Column(Float, nullable=False)
@@ -1,14 +1,22 @@
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Optional, Tuple
 import numpy as np
 import pandas as pd
+from scipy.sparse import csr_matrix
 from sklearn.ensemble import IsolationForest
 from sklearn.neighbors import LocalOutlierFactor
-from sklearn.preprocessing import StandardScaler
-from sklearn.metrics.pairwise import cosine_distances
 import logging
 
+# GPU（cuML）は任意依存。未インストール環境ではsklearnで実行する
+try:
+    import cupy
+    from cuml.neighbors import NearestNeighbors as GPUNearestNeighbors
+    CUML_AVAILABLE = True
+except ImportError:
+    CUML_AVAILABLE = False
+
 logger = logging.getLogger(__name__)
 
+
 class AnomalyDetectionService:
     """
     成功会話の中から異常なパターン（特殊成功例）を検出するサービス
@@ -16,21 +24,23 @@ class AnomalyDetectionService:
     一般的な成功パターンから外れた特殊な成功例を識別する
     """
     
-    def __init__(self, contamination_rate: float = 0.1):
+    def __init__(self, contamination_rate: float = 0.1, use_gpu: bool = False):
         """
         Args:
             contamination_rate: 異常とみなすデータの割合（0.05-0.2程度が推奨）
+            use_gpu: cuMLが利用可能な場合、LOFの近傍探索をGPUで実行する
         """
         self.contamination_rate = contamination_rate
+        self.use_gpu = use_gpu and CUML_AVAILABLE
         self.isolation_forest = None
         self.lof_detector = None
-        self.scaler = StandardScaler()
         
     def detect_anomalies(
         self, 
         conversation_vectors: np.ndarray,
         conversation_metadata: List[Dict[str, Any]],
-        method: str = "isolation_forest"
+        method: str = "isolation_forest",
+        detail_top_k: Optional[int] = None
     ) -> Dict[str, Any]:
         """
         成功会話ベクトルから異常例を検出
@@ -39,6 +49,7 @@ class AnomalyDetectionService:
             conversation_vectors: 成功会話のベクトル表現 (n_samples, n_features)
             conversation_metadata: 各会話のメタデータ
             method: 検出手法 ("isolation_forest" or "lof")
+            detail_top_k: outlier_details に含める件数（重心から遠い順）。未指定時は全件
             
         Returns:
             異常検出結果と詳細分析
@@ -46,23 +57,37 @@ class AnomalyDetectionService:
         try:
             logger.info(f"異常検出開始: {len(conversation_vectors)}件の成功会話を分析")
             
-            # ベクトルの正規化
-            normalized_vectors = self.scaler.fit_transform(conversation_vectors)
+            # 埋め込みの精度はfloat32で十分なため、以降の計算はすべてfloat32で行う
+            conversation_vectors = np.ascontiguousarray(conversation_vectors, dtype=np.float32)
             
             if method == "isolation_forest":
+                # 木の分割は特徴ごとの平行移動・スケールに不変なため正規化は不要
                 anomaly_results = self._isolation_forest_detection(
-                    normalized_vectors, conversation_metadata
+                    conversation_vectors, conversation_metadata
                 )
             elif method == "lof":
+                # 単位ベクトル化してユークリッド距離をコサイン距離と等価にする
+                norms = np.linalg.norm(conversation_vectors, axis=1, keepdims=True)
+                normalized_vectors = conversation_vectors / np.maximum(norms, 1e-12)
                 anomaly_results = self._lof_detection(
                     normalized_vectors, conversation_metadata
                 )
             else:
                 raise ValueError(f"Unknown method: {method}")
             
+            # メタデータは一度だけDataFrame化し、以降の集計はベクトル演算で行う
+            meta_df = pd.DataFrame.from_records(
+                conversation_metadata, columns=["success_rate", "text", "text_length"]
+            )
+            meta_df["success_rate"] = pd.to_numeric(meta_df["success_rate"], errors="coerce")
+            # DB由来のメタデータは保存済みの text_length を使い、無い場合のみ文字数を数える
+            meta_df["text_len"] = pd.to_numeric(meta_df["text_length"], errors="coerce").fillna(
+                meta_df["text"].fillna("").str.len()
+            )
+            
             # 異常度の詳細分析
             detailed_analysis = self._analyze_anomaly_patterns(
-                anomaly_results, conversation_vectors, conversation_metadata
+                anomaly_results, conversation_vectors, meta_df, detail_top_k
             )
             
             logger.info(f"異常検出完了: {len(anomaly_results['outlier_indices'])}件の特殊成功例を検出")
@@ -92,7 +117,8 @@ class AnomalyDetectionService:
         self.isolation_forest = IsolationForest(
             contamination=self.contamination_rate,
             random_state=42,
-            n_jobs=-1
+            n_jobs=-1,
+            **self._isolation_forest_params(*vectors.shape)
         )
         
         # 異常予測と異常スコア計算
@@ -109,6 +135,20 @@ class AnomalyDetectionService:
             "outlier_conversations": [metadata[i] for i in outlier_indices]
         }
     
+    @staticmethod
+    def _isolation_forest_params(n_samples: int, n_features: int) -> Dict[str, Any]:
+        """
+        データ件数に応じたIsolation Forestのパラメータ
+        小規模では木の本数を減らし、中規模以上はサブサンプルと特徴数を絞って学習コストを抑える
+        """
+        if n_samples < 5_000:
+            return {"n_estimators": 50, "max_samples": min(256, n_samples)}
+        return {
+            "n_estimators": 100,
+            "max_samples": 1024,
+            "max_features": min(64, n_features)
+        }
+    
     def _lof_detection(
         self, 
         vectors: np.ndarray, 
@@ -116,9 +156,15 @@ class AnomalyDetectionService:
     ) -> Dict[str, Any]:
         """Local Outlier Factorによる異常検出"""
         
+        if self.use_gpu:
+            return self._lof_detection_gpu(vectors, metadata)
+        
+        # 単位ベクトルに対する総当たり探索はfloat32のBLAS行列積で処理される
         self.lof_detector = LocalOutlierFactor(
             contamination=self.contamination_rate,
             n_neighbors=min(20, len(vectors) // 5),
+            algorithm="brute",
+            metric="euclidean",
             n_jobs=-1
         )
         
@@ -138,11 +184,69 @@ class AnomalyDetectionService:
             "outlier_conversations": [metadata[i] for i in outlier_indices]
         }
     
+    def _lof_detection_gpu(
+        self, 
+        vectors: np.ndarray, 
+        metadata: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """
+        cuMLでk近傍探索（O(N²)部分）をGPU実行し、LOF自体はsklearnで計算
+        近傍結果を自分自身（距離0）を含む疎なk近傍グラフにして metric="precomputed" で渡す
+        """
+        
+        n_samples = len(vectors)
+        n_neighbors = max(1, min(20, n_samples // 5))
+        knn = GPUNearestNeighbors(n_neighbors=n_neighbors + 1)
+        device_vectors = cupy.asarray(vectors, dtype=cupy.float32)
+        knn.fit(device_vectors)
+        distances, indices = knn.kneighbors(device_vectors)
+        
+        # 距離0の自分自身も明示的な要素として保持する（sklearn が自己近傍として除外する）
+        knn_graph = csr_matrix(
+            (
+                cupy.asnumpy(distances).ravel(),
+                cupy.asnumpy(indices).ravel(),
+                np.arange(0, n_samples * (n_neighbors + 1) + 1, n_neighbors + 1)
+            ),
+            shape=(n_samples, n_samples)
+        )
+        self.lof_detector = LocalOutlierFactor(
+            contamination=self.contamination_rate,
+            n_neighbors=n_neighbors,
+            metric="precomputed"
+        )
+        anomaly_labels = self.lof_detector.fit_predict(knn_graph)
+        lof_scores = -self.lof_detector.negative_outlier_factor_
+        outlier_indices = np.where(anomaly_labels == -1)[0]
+        
+        return {
+            "outlier_indices": outlier_indices.tolist(),
+            "lof_scores": lof_scores.tolist(),
+            "anomaly_labels": anomaly_labels.tolist(),
+            "outlier_conversations": [metadata[i] for i in outlier_indices]
+        }
+    
+    @staticmethod
+    def _cosine_distances_to(centroid: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+        """重心とのコサイン距離を1回の行列ベクトル積で計算（正規化済みコピーを作らない）"""
+        vectors = vectors.astype(np.float32, copy=False)
+        unit_centroid = centroid.astype(np.float32) / np.linalg.norm(centroid)
+        return 1.0 - (vectors @ unit_centroid) / np.linalg.norm(vectors, axis=1)
+    
+    @staticmethod
+    def _mean_std(values: pd.Series) -> Tuple[float, float]:
+        """平均と母標準偏差（欠損は除外、空の場合は0）"""
+        values = values.dropna()
+        if values.empty:
+            return 0, 0
+        return float(values.mean()), float(values.std(ddof=0))
+    
     def _analyze_anomaly_patterns(
         self,
         anomaly_results: Dict[str, Any],
         original_vectors: np.ndarray,
-        metadata: List[Dict[str, Any]]
+        meta_df: pd.DataFrame,
+        top_k: Optional[int] = None
     ) -> Dict[str, Any]:
         """異常例の詳細パターン分析"""
         
@@ -152,21 +256,28 @@ class AnomalyDetectionService:
         if not outlier_indices:
             return {"message": "異常例が検出されませんでした"}
         
-        # 正常例と異常例の特徴比較
-        normal_indices = [i for i in range(len(metadata)) if i not in outlier_indices]
-        normal_metadata = [metadata[i] for i in normal_indices]
+        # 正常例と異常例をマスクで分割
+        outlier_mask = np.zeros(len(meta_df), dtype=bool)
+        outlier_mask[outlier_indices] = True
         
         # 成約率の比較
-        normal_success_rates = [conv.get('success_rate', 0) for conv in normal_metadata if conv.get('success_rate') is not None]
-        outlier_success_rates = [conv.get('success_rate', 0) for conv in outlier_conversations if conv.get('success_rate') is not None]
+        normal_rate_avg, normal_rate_std = self._mean_std(meta_df.loc[~outlier_mask, "success_rate"])
+        outlier_rate_avg, outlier_rate_std = self._mean_std(meta_df.loc[outlier_mask, "success_rate"])
         
         # 会話長の比較
-        normal_lengths = [len(conv.get('text', '')) for conv in normal_metadata]
-        outlier_lengths = [len(conv.get('text', '')) for conv in outlier_conversations]
+        normal_len_avg, normal_len_std = self._mean_std(meta_df.loc[~outlier_mask, "text_len"])
+        outlier_len_avg, outlier_len_std = self._mean_std(meta_df.loc[outlier_mask, "text_len"])
         
-        # ベクトル空間での距離分析
-        centroid = np.mean(original_vectors[normal_indices], axis=0)
-        outlier_distances = cosine_distances([centroid], original_vectors[outlier_indices])[0]
+        # ベクトル空間での距離分析（正常例の重心からのコサイン距離）
+        centroid = np.mean(original_vectors[~outlier_mask], axis=0, dtype=np.float32)
+        outlier_distances = self._cosine_distances_to(centroid, original_vectors[outlier_mask])
+        
+        # 詳細は重心から遠い上位top_k件のみ（全体ソートせずargpartitionで選択）
+        if top_k is not None and top_k < len(outlier_distances):
+            detail_positions = np.argpartition(outlier_distances, -top_k)[-top_k:]
+            detail_positions = detail_positions[np.argsort(-outlier_distances[detail_positions])]
+        else:
+            detail_positions = np.arange(len(outlier_distances))
         
         # 特殊性の特徴分析
         special_characteristics = self._identify_special_characteristics(outlier_conversations)
@@ -174,16 +285,16 @@ class AnomalyDetectionService:
         return {
             "outlier_count": len(outlier_indices),
             "success_rate_comparison": {
-                "normal_avg": np.mean(normal_success_rates) if normal_success_rates else 0,
-                "outlier_avg": np.mean(outlier_success_rates) if outlier_success_rates else 0,
-                "normal_std": np.std(normal_success_rates) if normal_success_rates else 0,
-                "outlier_std": np.std(outlier_success_rates) if outlier_success_rates else 0
+                "normal_avg": normal_rate_avg,
+                "outlier_avg": outlier_rate_avg,
+                "normal_std": normal_rate_std,
+                "outlier_std": outlier_rate_std
             },
             "length_comparison": {
-                "normal_avg": np.mean(normal_lengths) if normal_lengths else 0,
-                "outlier_avg": np.mean(outlier_lengths) if outlier_lengths else 0,
-                "normal_std": np.std(normal_lengths) if normal_lengths else 0,
-                "outlier_std": np.std(outlier_lengths) if outlier_lengths else 0
+                "normal_avg": normal_len_avg,
+                "outlier_avg": outlier_len_avg,
+                "normal_std": normal_len_std,
+                "outlier_std": outlier_len_std
             },
             "distance_analysis": {
                 "avg_distance_to_centroid": np.mean(outlier_distances),
@@ -193,13 +304,13 @@ class AnomalyDetectionService:
             "special_characteristics": special_characteristics,
             "outlier_details": [
                 {
-                    "index": idx,
+                    "index": outlier_indices[i],
                     "conversation_id": outlier_conversations[i].get('session_id'),
                     "success_rate": outlier_conversations[i].get('success_rate'),
                     "distance_to_centroid": float(outlier_distances[i]),
                     "text_preview": outlier_conversations[i].get('text', '')[:200] + "..."
                 }
-                for i, idx in enumerate(outlier_indices)
+                for i in detail_positions
             ]
         }
     
@@ -209,43 +320,50 @@ class AnomalyDetectionService:
     ) -> Dict[str, Any]:
         """特殊成功例の特徴を分析"""
         
-        characteristics = {
-            "high_success_outliers": [],
-            "low_success_outliers": [],
-            "unusual_length_patterns": [],
-            "unique_counselor_styles": []
-        }
+        # 数値項目を一度だけ配列化し、各条件はマスクで判定する（欠損はNaN扱い）
+        success_rates = np.array(
+            [conv.get('success_rate', 0) for conv in outlier_conversations], dtype=np.float32
+        )
+        text_lengths = np.fromiter(
+            (
+                conv['text_length'] if conv.get('text_length') is not None else len(conv.get('text', ''))
+                for conv in outlier_conversations
+            ),
+            dtype=np.int32, count=len(outlier_conversations)
+        )
         
-        for conv in outlier_conversations:
-            success_rate = conv.get('success_rate', 0)
-            text_length = len(conv.get('text', ''))
-            counselor_id = conv.get('counselor_id')
-            
-            # 高成約率の特殊例
-            if success_rate > 0.9:
-                characteristics["high_success_outliers"].append({
-                    "conversation_id": conv.get('session_id'),
-                    "success_rate": success_rate,
+        high_mask = success_rates > 0.9  # 高成約率の特殊例
+        low_mask = success_rates < 0.5  # 低成約率だが成功とラベルされた例
+        length_mask = (text_lengths > 5000) | (text_lengths < 200)  # 極端な長さパターン
+        
+        # 該当したインデックスのみ辞書を組み立てる
+        return {
+            "high_success_outliers": [
+                {
+                    "conversation_id": outlier_conversations[i].get('session_id'),
+                    "success_rate": outlier_conversations[i].get('success_rate', 0),
                     "potential_factor": "exceptional_success_pattern"
-                })
-            
-            # 低成約率だが成功とラベルされた例
-            if success_rate < 0.5:
-                characteristics["low_success_outliers"].append({
-                    "conversation_id": conv.get('session_id'),
-                    "success_rate": success_rate,
+                }
+                for i in np.flatnonzero(high_mask)
+            ],
+            "low_success_outliers": [
+                {
+                    "conversation_id": outlier_conversations[i].get('session_id'),
+                    "success_rate": outlier_conversations[i].get('success_rate', 0),
                     "potential_factor": "unusual_success_despite_low_rate"
-                })
-            
-            # 極端な長さパターン
-            if text_length > 5000 or text_length < 200:
-                characteristics["unusual_length_patterns"].append({
-                    "conversation_id": conv.get('session_id'),
-                    "text_length": text_length,
-                    "pattern": "very_long" if text_length > 5000 else "very_short"
-                })
-        
-        return characteristics
+                }
+                for i in np.flatnonzero(low_mask)
+            ],
+            "unusual_length_patterns": [
+                {
+                    "conversation_id": outlier_conversations[i].get('session_id'),
+                    "text_length": int(text_lengths[i]),
+                    "pattern": "very_long" if text_lengths[i] > 5000 else "very_short"
+                }
+                for i in np.flatnonzero(length_mask)
+            ],
+            "unique_counselor_styles": []
+        }
     
     def get_anomaly_insights(self, anomaly_results: Dict[str, Any]) -> Dict[str, str]:
         """異常検出結果から実用的なインサイトを生成"""
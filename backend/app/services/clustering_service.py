@@ -4,14 +4,17 @@ K-means/HDBSCAN を使用したクラスタリングサービス
 import logging
 from typing import List, Dict, Any, Optional, Tuple
 import numpy as np
-from sklearn.cluster import KMeans, HDBSCAN
+from joblib import Parallel, delayed
+from sklearn.cluster import KMeans, MiniBatchKMeans, HDBSCAN
 from sklearn.metrics import silhouette_score, calinski_harabasz_score
 from sklearn.preprocessing import StandardScaler
-from sklearn.decomposition import PCA
+from sklearn.decomposition import PCA, TruncatedSVD
 import uuid
 from datetime import datetime
+from sqlalchemy import Text, cast, exists, func, insert, literal_column, select
 from sqlalchemy.orm import Session
 
+from app.core.config import settings
 from app.models.vector import (
     SuccessConversationVector,
     ClusterResult,
@@ -19,31 +22,175 @@ from app.models.vector import (
     ClusterRepresentative
 )
 
+# FAISSは任意依存。未インストール環境ではsklearnのK-meansで実行する
+try:
+    import faiss
+    FAISS_AVAILABLE = True
+except ImportError:
+    FAISS_AVAILABLE = False
+
 
 logger = logging.getLogger(__name__)
 
+# 直近に読み込んだ成功会話ベクトル（(件数, 行フィンガープリント) -> (vectors, vector_ids)）
+_success_vector_cache: Dict[Tuple[int, Optional[int]], Tuple[np.ndarray, List[str]]] = {}
+
+# この件数を超える場合、k-探索はMiniBatchKMeansで行い、選ばれたkのみ通常のK-meansで学習する
+MINIBATCH_SEARCH_THRESHOLD = 10_000
+# 増分更新でこの距離以上重心が移動したクラスタを「更新あり」とみなす
+CENTROID_SHIFT_THRESHOLD = 1e-3
+# 全件クラスタリングの結果として増分更新の基準にできるアルゴリズム
+FULL_KMEANS_ALGORITHMS = ("kmeans", "kmeans_faiss")
+
+
+def _sampled_silhouette_score(vectors: np.ndarray, labels: np.ndarray, sample_size: int) -> float:
+    """シルエット係数はO(N²·D)のため、sample_size件を超える場合はサンプリングして近似する"""
+    return float(silhouette_score(
+        vectors, labels,
+        sample_size=sample_size if len(vectors) > sample_size else None,
+        random_state=42
+    ))
+
+
+def _fit_kmeans_inertia(data: np.ndarray, k: int, random_state: int) -> float:
+    """Gap統計用にK-meansを学習してinertiaのみを返す"""
+    return float(KMeans(n_clusters=k, random_state=random_state).fit(data).inertia_)
+
+
+def _fit_reference_inertia(
+    low: np.ndarray,
+    high: np.ndarray,
+    n_samples: int,
+    data_seed: int,
+    k: int,
+    random_state: int
+) -> float:
+    """
+    Gap統計の参照データ（[low, high] の一様乱数）をワーカー内で生成してinertiaを返す
+    参照データ自体は転送せず、範囲とシードのみを受け渡す
+    """
+    rng = np.random.default_rng(data_seed)
+    reference = rng.uniform(low, high, (n_samples, len(low))).astype(np.float32)
+    return _fit_kmeans_inertia(reference, k, random_state)
+
+
+def _labeled_means(
+    vectors: np.ndarray,
+    labels: np.ndarray,
+    n_clusters: int,
+    counts: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    ラベルごとの平均ベクトルを1パスで計算（ラベル-1は除外）
+    one-hot行列との積（GEMM）で合計し、クラスタ数分の全件走査を避ける
+    """
+    labels = np.asarray(labels)
+    onehot = (labels[:, None] == np.arange(n_clusters)).astype(vectors.dtype)
+    if counts is None:
+        counts = np.bincount(labels[labels >= 0], minlength=n_clusters)[:n_clusters]
+    sums = onehot.T @ vectors
+    return sums / np.maximum(counts, 1)[:, None]
+
+
+def _distances_to_assigned_centroids(
+    vectors: np.ndarray,
+    labels: np.ndarray,
+    centroids: np.ndarray
+) -> np.ndarray:
+    """各ベクトルと所属クラスタ重心とのユークリッド距離を一括計算（ラベル-1はinf）"""
+    labels = np.asarray(labels)
+    noise = labels < 0
+    # ノイズは末尾のNaN行を参照させ、分岐なしで全件を計算してから最後にinfへ置き換える
+    centroid_of = np.vstack([centroids, np.full((1, vectors.shape[1]), np.nan, dtype=vectors.dtype)])
+    diffs = vectors - centroid_of[np.where(noise, len(centroids), labels)]
+    distances = np.sqrt(np.einsum('ij,ij->i', diffs, diffs)).astype(np.float64)
+    distances[noise] = np.inf
+    return distances
+
+
+def _svd_project(vectors: np.ndarray, n_components: int, normalize: bool) -> Tuple[np.ndarray, float]:
+    """ランダム化Truncated SVDで低次元に射影する（K-meansの距離計算 O(N·K·d) の d を削減）"""
+    svd = TruncatedSVD(n_components=n_components, algorithm='randomized', n_iter=5, random_state=42)
+    projected = svd.fit_transform(vectors).astype(np.float32, copy=False)
+    if normalize:
+        projected /= np.maximum(np.linalg.norm(projected, axis=1, keepdims=True), 1e-12)
+    return projected, float(svd.explained_variance_ratio_.sum())
+
+
+# faiss.Kmeans のパラメータ名 -> sklearn KMeans のパラメータ名（spherical, gpu は対応なし）
+_FAISS_TO_SKLEARN_PARAMS = {
+    'niter': 'max_iter',
+    'nredo': 'n_init',
+    'seed': 'random_state',
+    'silhouette_sample_size': 'silhouette_sample_size'
+}
+
+
+def _faiss_params_to_sklearn(params: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """faiss用のクラスタリングパラメータをsklearnのK-means用に読み替える（対応しないものは除外）"""
+    if not params:
+        return params
+    converted = {}
+    for name, value in params.items():
+        if name in _FAISS_TO_SKLEARN_PARAMS:
+            converted[_FAISS_TO_SKLEARN_PARAMS[name]] = value
+        elif name not in ('spherical', 'gpu'):
+            converted[name] = value  # sklearn側のパラメータ名で指定されたもの
+    return converted
+
+
+def _fit_kmeans_for_k(
+    vectors: np.ndarray,
+    k: int,
+    kmeans_params: Dict[str, Any],
+    sample_size: int,
+    use_minibatch: bool = False
+) -> Tuple[int, KMeans, np.ndarray, Optional[float]]:
+    """k-探索の1ステップ（学習とシルエット係数の算出）"""
+    if use_minibatch:
+        kmeans = MiniBatchKMeans(
+            n_clusters=k,
+            init=kmeans_params.get('init', 'k-means++'),
+            n_init=1,
+            batch_size=min(len(vectors), 1024),
+            random_state=kmeans_params.get('random_state')
+        )
+    else:
+        kmeans = KMeans(n_clusters=k, **kmeans_params)
+    labels = kmeans.fit_predict(vectors)
+    silhouette_avg = (
+        _sampled_silhouette_score(vectors, labels, sample_size) if np.unique(labels).size > 1 else None
+    )
+    return k, kmeans, labels, silhouette_avg
+
 
 class ClusteringService:
     """成功会話ベクトルのクラスタリングサービス"""
     
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, n_jobs: int = -1):
         self.db = db
+        self.n_jobs = n_jobs  # k探索でのjoblib並列数（プロセスプール内では呼び出し側で制限する）
     
     async def perform_clustering(
         self,
         algorithm: str = "kmeans",
         k_range: Tuple[int, int] = (2, 15),
         auto_select_k: bool = True,
-        clustering_params: Optional[Dict[str, Any]] = None
+        clustering_params: Optional[Dict[str, Any]] = None,
+        normalize: bool = True,
+        svd_components: Optional[int] = None
     ) -> Dict[str, Any]:
         """
         成功会話ベクトルのクラスタリング実行
         
         Args:
-            algorithm: 'kmeans' or 'hdbscan'
+            algorithm: 'kmeans', 'kmeans_faiss' or 'hdbscan'
             k_range: K-meansの場合のクラスタ数範囲
             auto_select_k: 最適クラスタ数の自動決定
             clustering_params: アルゴリズム固有のパラメータ
+            normalize: ベクトルをL2正規化する（ユークリッド距離がコサイン距離と同順序になる）
+            svd_components: K-means系ではTruncated SVDでこの次元に射影してから学習する（Noneで無効）
+                重心・重心距離・評価指標は元の次元で計算し直す（k探索のスコアのみ射影空間の値）
             
         Returns:
             {
@@ -58,20 +205,49 @@ class ClusteringService:
         """
         try:
             # 1. 成功会話ベクトルを取得
-            vectors_data = self._get_success_vectors()
-            if len(vectors_data) < 2:
+            vectors, vector_ids = self._get_success_vectors()
+            if len(vectors) < 2:
                 raise ValueError("クラスタリングには最低2つの成功会話ベクトルが必要です")
             
-            vectors = np.array([item['embedding'] for item in vectors_data])
-            vector_ids = [item['id'] for item in vectors_data]
+            if normalize:
+                # 分母も float32 のまま計算し、float64 への昇格を避ける
+                vectors = vectors / np.maximum(
+                    np.linalg.norm(vectors, axis=1, keepdims=True), np.float32(1e-12)
+                )
             
             logger.info(f"クラスタリング対象: {len(vectors)}件のベクトル")
             
+            # K-means系は低次元に射影したベクトルで学習する（代表例抽出などは元の次元のまま）
+            cluster_vectors = vectors
+            svd_explained_variance = None
+            if (
+                algorithm in ("kmeans", "kmeans_faiss")
+                and svd_components
+                and svd_components < min(vectors.shape)
+            ):
+                cluster_vectors, svd_explained_variance = _svd_project(vectors, svd_components, normalize)
+                logger.info(
+                    "SVD射影: %d次元 -> %d次元（説明分散比 %.3f）",
+                    vectors.shape[1], svd_components, svd_explained_variance
+                )
+            
             # 2. アルゴリズムに応じてクラスタリング実行
             if algorithm == "kmeans":
                 clustering_result = await self._perform_kmeans_clustering(
-                    vectors, k_range, auto_select_k, clustering_params
+                    cluster_vectors, k_range, auto_select_k, clustering_params
                 )
+            elif algorithm == "kmeans_faiss":
+                if FAISS_AVAILABLE:
+                    clustering_result = await self._perform_faiss_kmeans_clustering(
+                        cluster_vectors, k_range, auto_select_k, clustering_params
+                    )
+                else:
+                    logger.warning("faissが利用できないためsklearnのK-meansで実行します")
+                    algorithm = "kmeans"
+                    clustering_result = await self._perform_kmeans_clustering(
+                        cluster_vectors, k_range, auto_select_k,
+                        _faiss_params_to_sklearn(clustering_params)
+                    )
             elif algorithm == "hdbscan":
                 clustering_result = await self._perform_hdbscan_clustering(
                     vectors, clustering_params
@@ -79,6 +255,35 @@ class ClusteringService:
             else:
                 raise ValueError(f"サポートされていないアルゴリズム: {algorithm}")
             
+            if svd_explained_variance is not None:
+                # 重心・重心距離・評価指標は保存する重心と同じ元の埋め込み空間で計算し直す
+                labels = np.asarray(clustering_result['labels'])
+                full_centroids = _labeled_means(vectors, labels, clustering_result['cluster_count'])
+                full_distances = _distances_to_assigned_centroids(vectors, labels, full_centroids)
+                clustering_result['centroids'] = full_centroids.tolist()
+                for assignment, distance in zip(clustering_result['assignments'], full_distances):
+                    assignment['distance_to_centroid'] = float(distance)
+                
+                full_silhouette = (
+                    _sampled_silhouette_score(
+                        vectors, labels, clustering_result['parameters']['silhouette_sample_size']
+                    )
+                    if np.unique(labels).size > 1 else 0
+                )
+                clustering_result['silhouette_score'] = full_silhouette
+                metrics = clustering_result['performance_metrics']
+                metrics['silhouette_score'] = full_silhouette
+                metrics['inertia'] = float(np.square(full_distances, dtype=np.float64).sum())
+                if 'calinski_harabasz_score' in metrics:
+                    metrics['calinski_harabasz_score'] = calinski_harabasz_score(vectors, labels)
+                # k探索時のスコアは射影空間での値であることを明示する
+                metrics['projected_scores_by_k'] = metrics.pop('scores_by_k')
+                clustering_result['parameters'] = {
+                    **clustering_result['parameters'],
+                    'svd_components': svd_components,
+                    'svd_explained_variance': svd_explained_variance
+                }
+            
             # 3. 結果をデータベースに保存
             cluster_result_id = await self._save_clustering_result(
                 algorithm=algorithm,
@@ -87,7 +292,7 @@ class ClusteringService:
                 silhouette_score=clustering_result['silhouette_score'],
                 labels=clustering_result['labels'],
                 vector_ids=vector_ids,
-                centroids=clustering_result.get('centroids')
+                distances=[a['distance_to_centroid'] for a in clustering_result['assignments']]
             )
             
             return {
@@ -104,21 +309,208 @@ class ClusteringService:
             logger.error(f"クラスタリング実行エラー: {e}")
             raise
     
-    def _get_success_vectors(self) -> List[Dict[str, Any]]:
-        """成功会話ベクトルを取得"""
-        query = self.db.query(SuccessConversationVector).filter(
-            SuccessConversationVector.is_success == True
-        ).all()
+    def find_incremental_base(self, max_new_ratio: float) -> Optional[uuid.UUID]:
+        """
+        増分更新の基点にする直近のK-means結果のIDを返す
         
-        return [
-            {
-                'id': str(vector.id),
-                'session_id': str(vector.session_id),
-                'embedding': vector.embedding,
-                'text': vector.chunk_text
+        直近の全件K-means結果に割り当てられていない成功会話ベクトル（新規ベクトル）の比率が
+        max_new_ratio を超える場合、または全件K-means結果が無い場合は None（全件クラスタリングが必要）。
+        比率は全件結果を基準に数えるため、増分更新を重ねても新規分が溜まれば全件に戻る
+        """
+        if max_new_ratio <= 0:
+            return None
+        full_result_id = self.db.scalar(
+            select(ClusterResult.id)
+            .where(ClusterResult.algorithm.in_(FULL_KMEANS_ALGORITHMS))
+            .order_by(ClusterResult.created_at.desc())
+            .limit(1)
+        )
+        if full_result_id is None:
+            return None
+        
+        total, new = self.db.execute(
+            select(
+                func.count(SuccessConversationVector.id),
+                func.count(SuccessConversationVector.id).filter(~exists().where(
+                    ClusterAssignment.cluster_result_id == full_result_id,
+                    ClusterAssignment.vector_id == SuccessConversationVector.id
+                ))
+            ).where(SuccessConversationVector.is_success == True)
+        ).one()
+        if total == 0 or new / total > max_new_ratio:
+            logger.info("新規ベクトル %d/%d 件のため全件クラスタリングを実行します", new, total)
+            return None
+        
+        # 全件結果以降に増分更新済みであれば、その最新の結果を基点にする
+        return self.db.scalar(
+            select(ClusterResult.id)
+            .where(ClusterResult.algorithm.in_(FULL_KMEANS_ALGORITHMS + ("kmeans_incremental",)))
+            .order_by(ClusterResult.created_at.desc())
+            .limit(1)
+        )
+    
+    async def update_clustering_incrementally(
+        self,
+        previous_cluster_result_id: uuid.UUID,
+        normalize: bool = True,
+        centroid_shift_threshold: float = CENTROID_SHIFT_THRESHOLD
+    ) -> Dict[str, Any]:
+        """
+        前回のK-means結果を初期値として、新規ベクトルのみで重心を更新する
+        既存ベクトルの割り当ては引き継ぎ、新規ベクトルを最寄り重心に割り当てて
+        件数で重み付けした移動平均で重心を更新する（全件の再クラスタリングを避け O(新規件数·K·d)）
+        
+        Returns:
+            perform_clustering と同じ形式に 'new_vector_count' と
+            'updated_clusters'（重心が centroid_shift_threshold 以上移動したクラスタ）を加えたもの
+        """
+        try:
+            previous = self.db.get(ClusterResult, previous_cluster_result_id)
+            if previous is None:
+                raise ValueError(f"クラスタリング結果が見つかりません: {previous_cluster_result_id}")
+            if previous.algorithm not in FULL_KMEANS_ALGORITHMS + ("kmeans_incremental",):
+                raise ValueError(f"増分更新はK-meansの結果のみ対応しています: {previous.algorithm}")
+            
+            vectors, vector_ids = self._get_success_vectors()
+            if normalize:
+                vectors = vectors / np.maximum(
+                    np.linalg.norm(vectors, axis=1, keepdims=True), np.float32(1e-12)
+                )
+            
+            # 前回の割り当てを引き継ぐ（前回以降に追加されたベクトルは -1）
+            previous_labels = {
+                str(vector_id): label
+                for vector_id, label in self.db.execute(
+                    select(ClusterAssignment.vector_id, ClusterAssignment.cluster_label)
+                    .where(ClusterAssignment.cluster_result_id == previous_cluster_result_id)
+                )
             }
-            for vector in query
-        ]
+            labels = np.fromiter(
+                (previous_labels.get(vector_id, -1) for vector_id in vector_ids),
+                dtype=np.int64, count=len(vector_ids)
+            )
+            known = labels >= 0
+            if not known.any():
+                raise ValueError("前回の割り当てに一致するベクトルがありません")
+            
+            k = previous.cluster_count
+            counts = np.bincount(labels[known], minlength=k)[:k]
+            previous_centroids = _labeled_means(vectors[known], labels[known], k, counts)
+            centroids = previous_centroids
+            
+            new_mask = ~known
+            new_vector_count = int(new_mask.sum())
+            if new_vector_count:
+                new_vectors = vectors[new_mask]
+                # 最寄り重心は ||c||² - 2x·c の最小で決まる（||x||² は行ごとに定数）
+                new_labels = (
+                    np.einsum('ij,ij->i', centroids, centroids)[None, :] - 2.0 * (new_vectors @ centroids.T)
+                ).argmin(axis=1)
+                new_counts = np.bincount(new_labels, minlength=k)
+                new_means = _labeled_means(new_vectors, new_labels, k, new_counts)
+                totals = counts + new_counts
+                centroids = (
+                    previous_centroids * counts[:, None] + new_means * new_counts[:, None]
+                ) / np.maximum(totals, 1)[:, None]
+                labels[new_mask] = new_labels
+            
+            shifts = np.linalg.norm(centroids - previous_centroids, axis=1)
+            updated_clusters = np.flatnonzero(shifts >= centroid_shift_threshold).tolist()
+            logger.info(
+                "増分クラスタリング: 新規%d件, 重心が移動したクラスタ %s",
+                new_vector_count, updated_clusters
+            )
+            
+            distances = _distances_to_assigned_centroids(vectors, labels, centroids)
+            score = (
+                _sampled_silhouette_score(vectors, labels, 2000)
+                if np.unique(labels).size > 1 else 0
+            )
+            parameters = {
+                'base_cluster_result_id': str(previous_cluster_result_id),
+                'new_vector_count': new_vector_count,
+                'centroid_shift_threshold': centroid_shift_threshold
+            }
+            cluster_result_id = await self._save_clustering_result(
+                algorithm="kmeans_incremental",
+                cluster_count=k,
+                parameters=parameters,
+                silhouette_score=score,
+                labels=labels,
+                vector_ids=vector_ids,
+                distances=distances
+            )
+            
+            return {
+                'cluster_result_id': str(cluster_result_id),
+                'algorithm': "kmeans_incremental",
+                'cluster_count': k,
+                'silhouette_score': score,
+                'cluster_assignments': [
+                    {
+                        'vector_index': i,
+                        'cluster_label': int(label),
+                        'distance_to_centroid': float(distance)
+                    }
+                    for i, (label, distance) in enumerate(zip(labels, distances))
+                ],
+                'cluster_centroids': centroids.tolist(),
+                'performance_metrics': {
+                    'silhouette_score': score,
+                    'centroid_shifts': shifts.tolist()
+                },
+                'new_vector_count': new_vector_count,
+                'updated_clusters': updated_clusters
+            }
+            
+        except Exception as e:
+            logger.error(f"増分クラスタリングエラー: {e}")
+            raise
+    
+    def _get_success_vectors(self, chunk_size: int = 10_000) -> Tuple[np.ndarray, List[str]]:
+        """
+        成功会話ベクトルを取得
+        サーバーサイドカーソルでchunk_size件ずつ読み込み、ORMオブジェクトや本文は保持しない
+        件数と行フィンガープリントが前回と同じ場合はプロセス内のキャッシュを返す
+        
+        フィンガープリントは各行の id と xmin のハッシュの総和。xmin は行の挿入・更新ごとに
+        変わるため、同じ秒内の削除と追加や既存行の更新（is_success の変更など）も検知できる。
+        クラスタリングは別プロセスで実行されるため、書き込み側からの明示的な無効化には頼らない
+        """
+        cache_key = tuple(self.db.query(
+            func.count(SuccessConversationVector.id),
+            func.sum(func.hashtext(func.concat(
+                cast(SuccessConversationVector.id, Text), literal_column("xmin::text")
+            )))
+        ).filter(SuccessConversationVector.is_success == True).one())
+        cached = _success_vector_cache.get(cache_key)
+        if cached is not None:
+            logger.info("成功会話ベクトルをキャッシュから取得: %d件", cache_key[0])
+            return cached
+        
+        result = self.db.execute(
+            select(SuccessConversationVector.id, SuccessConversationVector.embedding)
+            .where(SuccessConversationVector.is_success == True)
+            .execution_options(yield_per=chunk_size)
+        )
+        
+        # 件数は取得済みなので配列を先に確保し、各行を直接書き込む（中間リストを作らない）
+        vectors = np.empty((cache_key[0], settings.EMBEDDING_DIMENSIONS), dtype=np.float32)
+        vector_ids: List[str] = []
+        for partition in result.partitions():
+            for row in partition:
+                if len(vector_ids) == len(vectors):
+                    break  # 件数取得後に追加された行は次回の読み込みに回す
+                vectors[len(vector_ids)] = row.embedding
+                vector_ids.append(str(row.id))
+        
+        vectors = vectors[:len(vector_ids)]
+        vectors.flags.writeable = False  # キャッシュを共有するため読み取り専用にする
+        _success_vector_cache.clear()
+        if len(vector_ids) == cache_key[0]:
+            # 件数取得と読み込みの間に行が増減した場合はキャッシュしない
+            _success_vector_cache[cache_key] = (vectors, vector_ids)
+        return vectors, vector_ids
     
     async def _perform_kmeans_clustering(
         self,
@@ -130,59 +522,73 @@ class ClusteringService:
         """K-meansクラスタリング実行"""
         
         # デフォルトパラメータ
+        # k-means++ の初期値で十分なため再試行は1回、Elkan法で距離計算を枝刈りする
+        # （初期値依存を抑えたい場合は params で n_init を上書きする）
         default_params = {
-            'n_init': 10,
+            'n_init': 1,
+            'init': 'k-means++',
+            'algorithm': 'elkan',
             'max_iter': 300,
-            'random_state': 42
+            'random_state': 42,
+            'silhouette_sample_size': 2000
         }
         if params:
             default_params.update(params)
+        kmeans_params = {k: v for k, v in default_params.items() if k != 'silhouette_sample_size'}
+        sample_size = default_params['silhouette_sample_size']
         
         best_k = k_range[0]
         best_score = -1
         best_model = None
+        best_labels = None
         scores_by_k = {}
         
         if auto_select_k:
             # 最適なクラスタ数を探索
             logger.info(f"最適クラスタ数探索中: {k_range[0]}-{k_range[1]}")
             
-            for k in range(k_range[0], min(k_range[1] + 1, len(vectors))):
-                kmeans = KMeans(n_clusters=k, **default_params)
-                labels = kmeans.fit_predict(vectors)
-                
-                # シルエット係数で評価
-                if len(set(labels)) > 1:  # クラスタが複数ある場合のみ
-                    silhouette_avg = float(silhouette_score(vectors, labels))
+            # 各kの学習は独立しているためプロセス並列で実行する
+            use_minibatch = len(vectors) > MINIBATCH_SEARCH_THRESHOLD
+            search_results = Parallel(n_jobs=self.n_jobs, backend='loky')(
+                delayed(_fit_kmeans_for_k)(vectors, k, kmeans_params, sample_size, use_minibatch)
+                for k in range(k_range[0], min(k_range[1] + 1, len(vectors)))
+            )
+            
+            for k, kmeans, labels, silhouette_avg in search_results:
+                # シルエット係数で評価（クラスタが複数ある場合のみ算出済み）
+                if silhouette_avg is not None:
                     scores_by_k[k] = silhouette_avg
                     
                     if silhouette_avg > best_score:
                         best_score = silhouette_avg
                         best_k = k
                         best_model = kmeans
+                        best_labels = labels
                         
-                    logger.info(f"K={k}: シルエット係数={silhouette_avg:.3f}")
+                    logger.info("K=%d: シルエット係数=%.3f", k, silhouette_avg)
+            
+            # ミニバッチ探索の場合は選ばれたkで通常のK-meansを学習し直す
+            if use_minibatch:
+                best_model = None
         else:
             # 指定されたクラスタ数で実行
             best_k = k_range[0]
-            best_model = KMeans(n_clusters=best_k, **default_params)
-            labels = best_model.fit_predict(vectors)
-            best_score = silhouette_score(vectors, labels) if len(set(labels)) > 1 else 0
+            best_model = KMeans(n_clusters=best_k, **kmeans_params)
+            best_labels = best_model.fit_predict(vectors)
+            best_score = (
+                _sampled_silhouette_score(vectors, best_labels, sample_size)
+                if np.unique(best_labels).size > 1 else 0
+            )
         
-        # 最終的なクラスタリング結果
-        final_labels = best_model.fit_predict(vectors)
+        # 最終的なクラスタリング結果（探索時に学習済みのモデルとラベルを再利用する）
+        if best_model is None:
+            best_model = KMeans(n_clusters=best_k, **kmeans_params)
+            best_labels = best_model.fit_predict(vectors)
+        final_labels = best_labels
         centroids = best_model.cluster_centers_
         
-        # 各ベクトルの重心からの距離を計算
-        distances_to_centroids = []
-        for i, (vector, label) in enumerate(zip(vectors, final_labels)):
-            label = int(label)  # numpyスカラーをintに変換
-            if label >= 0:  # 有効なクラスタ
-                centroid = centroids[label]
-                distance = np.linalg.norm(vector - centroid)
-                distances_to_centroids.append(distance)
-            else:
-                distances_to_centroids.append(float('inf'))
+        # 各ベクトルの重心からの距離を計算（K-meansにノイズはない）
+        distances_to_centroids = _distances_to_assigned_centroids(vectors, final_labels, centroids)
         
         # パフォーマンスメトリクス
         performance_metrics = {
@@ -192,7 +598,7 @@ class ClusteringService:
             'scores_by_k': scores_by_k
         }
         
-        if len(set(final_labels)) > 1:
+        if np.unique(final_labels).size > 1:
             performance_metrics['calinski_harabasz_score'] = calinski_harabasz_score(
                 vectors, final_labels
             )
@@ -216,6 +622,99 @@ class ClusteringService:
             'performance_metrics': performance_metrics
         }
     
+    async def _perform_faiss_kmeans_clustering(
+        self,
+        vectors: np.ndarray,
+        k_range: Tuple[int, int],
+        auto_select_k: bool,
+        params: Optional[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """FAISSによるK-meansクラスタリング実行（GPUが利用可能な場合はGPUで学習）"""
+        
+        # デフォルトパラメータ
+        default_params = {
+            'niter': 20,
+            'nredo': 1,
+            'seed': 42,
+            # 各反復で重心を単位長に正規化し、コサイン類似度に沿ったクラスタを作る
+            'spherical': True,
+            'gpu': faiss.get_num_gpus() > 0,
+            'silhouette_sample_size': 2000
+        }
+        if params:
+            default_params.update(params)
+        sample_size = default_params['silhouette_sample_size']
+        train_vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        
+        def fit(k: int) -> Tuple[Any, np.ndarray]:
+            kmeans = faiss.Kmeans(
+                train_vectors.shape[1], k,
+                niter=default_params['niter'],
+                nredo=default_params['nredo'],
+                seed=default_params['seed'],
+                spherical=default_params['spherical'],
+                gpu=default_params['gpu']
+            )
+            kmeans.train(train_vectors)
+            _, assigned = kmeans.index.search(train_vectors, 1)
+            return kmeans, assigned.ravel()
+        
+        if auto_select_k:
+            logger.info(f"最適クラスタ数探索中(faiss): {k_range[0]}-{k_range[1]}")
+            k_values = list(range(k_range[0], min(k_range[1] + 1, len(vectors))))
+        else:
+            k_values = [k_range[0]]
+        
+        best_k = k_values[0] if k_values else k_range[0]
+        best_score = -1
+        best_model = None
+        best_labels = None
+        scores_by_k = {}
+        
+        for k in k_values:
+            kmeans, labels = fit(k)
+            silhouette_avg = (
+                _sampled_silhouette_score(vectors, labels, sample_size)
+                if np.unique(labels).size > 1 else 0
+            )
+            scores_by_k[k] = silhouette_avg
+            if best_model is None or silhouette_avg > best_score:
+                best_score = silhouette_avg
+                best_k = k
+                best_model = kmeans
+                best_labels = labels
+        
+        if best_model is None:
+            best_model, best_labels = fit(best_k)
+        centroids = best_model.centroids
+        distances_to_centroids = _distances_to_assigned_centroids(vectors, best_labels, centroids)
+        
+        performance_metrics = {
+            'silhouette_score': best_score,
+            'inertia': float(best_model.obj[-1]) if len(best_model.obj) else None,
+            'scores_by_k': scores_by_k,
+            'gpu': default_params['gpu']
+        }
+        
+        assignments = [
+            {
+                'vector_index': i,
+                'cluster_label': int(label),
+                'distance_to_centroid': float(distance)
+            }
+            for i, (label, distance) in enumerate(zip(best_labels, distances_to_centroids))
+        ]
+        
+        return {
+            'cluster_count': best_k,
+            'labels': best_labels.tolist(),
+            'centroids': centroids.tolist(),
+            'silhouette_score': best_score,
+            'parameters': default_params,
+            'assignments': assignments,
+            'performance_metrics': performance_metrics
+        }
+    
     async def _perform_hdbscan_clustering(
         self,
         vectors: np.ndarray,
@@ -227,58 +726,52 @@ class ClusteringService:
         default_params = {
             'min_cluster_size': max(5, len(vectors) // 10),  # 動的に調整
             'min_samples': 3,
-            'metric': 'cosine',
+            'metric': 'euclidean',  # 正規化済みベクトルではコサインと等価で、木構造の高速化が効く
             'cluster_selection_epsilon': 0.0,
-            'alpha': 1.0
+            'alpha': 1.0,
+            'silhouette_sample_size': 2000
         }
         if params:
             default_params.update(params)
+        hdbscan_params = {k: v for k, v in default_params.items() if k != 'silhouette_sample_size'}
         
         logger.info(f"HDBSCAN実行中: パラメータ={default_params}")
         
         # HDBSCANクラスタリング実行
-        clusterer = HDBSCAN(**default_params)
+        clusterer = HDBSCAN(**hdbscan_params)
         cluster_labels = clusterer.fit_predict(vectors)
         
-        # ノイズ（-1ラベル）を除いたクラスタ数
-        unique_labels = set(cluster_labels)
-        n_clusters = len(unique_labels) - (1 if -1 in unique_labels else 0)
+        # ノイズ（-1ラベル）を除いたクラスタ数（ラベルの集計は一度だけ行い以降で再利用する）
+        unique_labels, label_counts = np.unique(cluster_labels, return_counts=True)
+        clustered = unique_labels >= 0
+        n_clusters = int(clustered.sum())
         
         # シルエット係数計算（ノイズを除く）
         silhouette_avg = 0.0
         if n_clusters > 1:
             valid_indices = cluster_labels >= 0
             if np.sum(valid_indices) > 1:
-                silhouette_avg = float(silhouette_score(
-                    vectors[valid_indices], 
-                    cluster_labels[valid_indices]
-                ))
+                silhouette_avg = _sampled_silhouette_score(
+                    vectors[valid_indices],
+                    cluster_labels[valid_indices],
+                    default_params['silhouette_sample_size']
+                )
         
-        # 各ベクトルの所属クラスタ重心からの距離を計算
-        distances_to_centroids = []
-        cluster_centroids = {}
-        
-        # 各クラスタの重心を計算
-        for label in unique_labels:
-            if int(label) >= 0:  # ノイズではない
-                cluster_vectors = vectors[cluster_labels == label]
-                centroid = np.mean(cluster_vectors, axis=0)
-                cluster_centroids[label] = centroid
-        
-        # 各ベクトルの重心からの距離
-        for i, label in enumerate(cluster_labels):
-            label = int(label)  # numpyスカラーをintに変換
-            if label >= 0 and label in cluster_centroids:
-                distance = np.linalg.norm(vectors[i] - cluster_centroids[label])
-                distances_to_centroids.append(distance)
-            else:
-                distances_to_centroids.append(float('inf'))  # ノイズ
+        # 各クラスタの重心を計算（行番号 = ラベル）
+        cluster_centroids = _labeled_means(
+            vectors, cluster_labels, n_clusters, counts=label_counts[clustered]
+        )
+        
+        # 各ベクトルの所属クラスタ重心からの距離（ノイズはinf）
+        distances_to_centroids = _distances_to_assigned_centroids(
+            vectors, cluster_labels, cluster_centroids
+        )
         
         # パフォーマンスメトリクス
         performance_metrics = {
             'silhouette_score': silhouette_avg,
             'n_clusters': n_clusters,
-            'n_noise': np.sum(cluster_labels == -1),
+            'n_noise': int(label_counts[unique_labels == -1].sum()),
             'cluster_persistence': clusterer.cluster_persistence_.tolist() if hasattr(clusterer, 'cluster_persistence_') else None
         }
         
@@ -294,7 +787,7 @@ class ClusteringService:
         return {
             'cluster_count': n_clusters,
             'labels': cluster_labels.tolist(),
-            'centroids': [centroid.tolist() for centroid in cluster_centroids.values()],
+            'centroids': cluster_centroids.tolist(),
             'silhouette_score': silhouette_avg,
             'parameters': default_params,
             'assignments': assignments,
@@ -309,15 +802,13 @@ class ClusteringService:
         silhouette_score: float,
         labels: List[int],
         vector_ids: List[str],
-        centroids: Optional[List[List[float]]] = None
+        distances: Optional[List[float]] = None
     ) -> uuid.UUID:
         """クラスタリング結果をデータベースに保存"""
         
         try:
-            logger.info(f"💾 Saving clustering result - algorithm: {algorithm}, clusters: {cluster_count}")
-            logger.info(f"📊 Labels type: {type(labels)}, length: {len(labels) if hasattr(labels, '__len__') else 'no length'}")
-            logger.info(f"📋 Labels preview: {labels[:5] if len(labels) >= 5 else labels}")
-            logger.info(f"🎯 Centroids type: {type(centroids)}, shape: {centroids.shape if hasattr(centroids, 'shape') else 'no shape'}")
+            logger.info("💾 Saving clustering result - algorithm: %s, clusters: %d", algorithm, cluster_count)
+            logger.debug("📋 Labels length: %d, preview: %s", len(labels), labels[:5])
             # ClusterResultを保存
             cluster_result = ClusterResult(
                 algorithm=algorithm,
@@ -328,36 +819,27 @@ class ClusteringService:
             self.db.add(cluster_result)
             self.db.flush()  # IDを取得するため
             
-            # ClusterAssignmentを一括保存
-            logger.info(f"🔄 Processing {len(labels)} cluster assignments")
+            # ClusterAssignmentはORMを介さず複数行INSERTで一括保存
+            logger.info("🔄 Processing %d cluster assignments", len(labels))
             assignments = []
             for i, (vector_id, label) in enumerate(zip(vector_ids, labels)):
-                logger.debug(f"Processing assignment {i}: vector_id={vector_id}, label={label} (type: {type(label)})")
                 # numpyスカラーをPythonのintに変換
                 label = int(label)
                 
-                # 重心からの距離を計算（centroids が利用可能な場合）
+                # 重心からの距離はクラスタリング時の計算結果を使う（ノイズはNone）
                 distance_to_centroid = None
-                logger.debug(f"Checking centroids: centroids={centroids is not None}, label={label}, label >= 0: {label >= 0}")
-                if centroids is not None and label >= 0 and label < len(centroids):
-                    vector_embedding = self.db.query(SuccessConversationVector.embedding).filter(
-                        SuccessConversationVector.id == vector_id
-                    ).scalar()
-                    
-                    if vector_embedding is not None:
-                        centroid = np.array(centroids[label])
-                        vector_np = np.array(vector_embedding)
-                        distance_to_centroid = float(np.linalg.norm(vector_np - centroid))
+                if distances is not None and label >= 0:
+                    distance_to_centroid = float(distances[i])
                 
-                assignment = ClusterAssignment(
-                    vector_id=vector_id,
-                    cluster_result_id=cluster_result.id,
-                    cluster_label=label,
-                    distance_to_centroid=distance_to_centroid
-                )
-                assignments.append(assignment)
+                assignments.append({
+                    'vector_id': vector_id,
+                    'cluster_result_id': cluster_result.id,
+                    'cluster_label': label,
+                    'distance_to_centroid': distance_to_centroid
+                })
             
-            self.db.add_all(assignments)
+            if assignments:
+                self.db.execute(insert(ClusterAssignment), assignments)
             self.db.commit()
             
             logger.info(f"クラスタリング結果保存完了: {cluster_result.id}")
@@ -372,9 +854,16 @@ class ClusteringService:
 class OptimalClustersDetector:
     """最適クラスタ数決定ユーティリティ"""
     
+    @staticmethod
+    def elbow_index(inertias: np.ndarray) -> Tuple[int, np.ndarray]:
+        """二次差分が最大となる点（エルボー）のインデックスと二次差分を返す"""
+        second_derivatives = np.diff(np.asarray(inertias, dtype=np.float64), n=2)
+        return int(np.argmax(second_derivatives)) + 1, second_derivatives
+    
     @staticmethod
     def elbow_method(vectors: np.ndarray, k_range: Tuple[int, int]) -> Dict[str, Any]:
         """エルボー法による最適クラスタ数決定"""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
         inertias = []
         k_values = list(range(k_range[0], min(k_range[1] + 1, len(vectors))))
         
@@ -383,20 +872,12 @@ class OptimalClustersDetector:
             kmeans.fit(vectors)
             inertias.append(kmeans.inertia_)
         
-        # エルボーポイントを自動検出
+        # エルボーポイントを自動検出（最大の二次微分を持つ点をエルボーとする）
+        second_derivatives = []
         if len(inertias) >= 3:
-            # 二次微分を計算してエルボーポイントを検出
-            second_derivatives = []
-            for i in range(1, len(inertias) - 1):
-                second_deriv = inertias[i-1] - 2*inertias[i] + inertias[i+1]
-                second_derivatives.append(second_deriv)
-            
-            # 最大の二次微分を持つ点をエルボーとする
-            if second_derivatives:
-                elbow_index = second_derivatives.index(max(second_derivatives)) + 1
-                optimal_k = k_values[elbow_index]
-            else:
-                optimal_k = k_values[len(k_values)//2]  # デフォルト
+            elbow_index, second_derivatives = OptimalClustersDetector.elbow_index(inertias)
+            optimal_k = k_values[elbow_index]
+            second_derivatives = second_derivatives.tolist()
         else:
             optimal_k = k_values[0]
         
@@ -404,48 +885,50 @@ class OptimalClustersDetector:
             'optimal_k': optimal_k,
             'k_values': k_values,
             'inertias': inertias,
-            'second_derivatives': second_derivatives if len(inertias) >= 3 else []
+            'second_derivatives': second_derivatives
         }
     
     @staticmethod
-    def gap_statistic(vectors: np.ndarray, k_range: Tuple[int, int], n_refs: int = 10) -> Dict[str, Any]:
+    def gap_statistic(
+        vectors: np.ndarray,
+        k_range: Tuple[int, int],
+        n_refs: int = 10,
+        n_jobs: int = -1
+    ) -> Dict[str, Any]:
         """Gap統計による最適クラスタ数決定"""
-        from sklearn.cluster import KMeans
-        import random
-        
-        gaps = []
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
         k_values = list(range(k_range[0], min(k_range[1] + 1, len(vectors))))
         
-        for k in k_values:
-            # 実データのクラスタリング
-            kmeans = KMeans(n_clusters=k, random_state=42)
-            kmeans.fit(vectors)
-            real_inertia = kmeans.inertia_
-            
-            # 参照データ（ランダム）のクラスタリング
-            ref_inertias = []
-            for _ in range(n_refs):
-                # 実データの範囲内でランダムデータを生成
-                min_vals = vectors.min(axis=0)
-                max_vals = vectors.max(axis=0)
-                random_data = np.random.uniform(min_vals, max_vals, vectors.shape)
-                
-                ref_kmeans = KMeans(n_clusters=k, random_state=random.randint(0, 1000))
-                ref_kmeans.fit(random_data)
-                ref_inertias.append(ref_kmeans.inertia_)
-            
-            # Gap値計算
-            mean_ref_inertia = np.mean(ref_inertias)
-            gap = np.log(mean_ref_inertia) - np.log(real_inertia)
-            gaps.append(gap)
+        # 参照データ（実データの範囲内の一様乱数）は各ワーカーでシードから生成する
+        # 同じ参照セットは同じシードから生成されるため、全kで共有される
+        rng = np.random.default_rng()
+        low, high = vectors.min(axis=0), vectors.max(axis=0)
+        data_seeds = rng.integers(0, 2**31 - 1, size=n_refs)
+        ref_seeds = rng.integers(0, 1000, size=(n_refs, len(k_values)))
+        
+        # 実データ・参照データのK-meansはすべて独立なので並列に学習する
+        parallel = Parallel(n_jobs=n_jobs, backend='loky')
+        real_inertias = np.array(parallel(
+            delayed(_fit_kmeans_inertia)(vectors, k, 42) for k in k_values
+        ))
+        ref_inertias = np.array(parallel(
+            delayed(_fit_reference_inertia)(
+                low, high, len(vectors), int(data_seeds[r]), k, int(ref_seeds[r, j])
+            )
+            for r in range(n_refs)
+            for j, k in enumerate(k_values)
+        )).reshape(n_refs, len(k_values))
+        
+        # Gap値計算
+        gaps = np.log(ref_inertias.mean(axis=0)) - np.log(real_inertias)
         
         # 最適クラスタ数は最大のGap値を持つk
-        optimal_k = k_values[gaps.index(max(gaps))]
+        optimal_k = k_values[int(np.argmax(gaps))]
         
         return {
             'optimal_k': optimal_k,
             'k_values': k_values,
-            'gaps': gaps
+            'gaps': gaps.tolist()
         }
 
 
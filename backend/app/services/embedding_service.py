@@ -2,19 +2,32 @@
 OpenAI Embedding API を使用したベクトル化サービス
 """
 import asyncio
+import base64
+import hashlib
 import logging
+import random
+import re
 from typing import List, Dict, Any, Optional
 import openai
 from openai import AsyncOpenAI
 import numpy as np
+import redis
 import tiktoken
 
 from app.core.config import settings
+from app.db.cache import get_redis_pool
 
 
 logger = logging.getLogger(__name__)
 
 
+def _get_embedding_cache_client() -> Optional[redis.Redis]:
+    """埋め込みキャッシュ用のRedisクライアントを取得（無効・未設定の場合はNone）"""
+    if not settings.EMBEDDING_CACHE_ENABLED or not settings.REDIS_URL:
+        return None
+    return redis.Redis(connection_pool=get_redis_pool())
+
+
 class EmbeddingService:
     """OpenAI text-embedding-3-small を使用したテキストベクトル化サービス"""
     
@@ -24,11 +37,21 @@ class EmbeddingService:
         self.encoding = tiktoken.get_encoding("cl100k_base")
         self.max_tokens = 512  # チャンク分割の最大トークン数
         self.batch_size = 20  # バッチ処理のサイズ
+        self.max_concurrency = 16  # 同時に送信するバッチリクエスト数の上限
+        self.max_retries = 5  # レート制限時の最大リトライ回数
+        self.cache_client = _get_embedding_cache_client()
+        self.cache_ttl = 30 * 24 * 3600  # 埋め込みキャッシュの有効期間（30日）
         
     def count_tokens(self, text: str) -> int:
         """テキストのトークン数をカウント"""
         return len(self.encoding.encode(text))
     
+    def count_tokens_batch(self, texts: List[str]) -> List[int]:
+        """複数テキストのトークン数を encode_batch で一度にカウント"""
+        if not texts:
+            return []
+        return [len(tokens) for tokens in self.encoding.encode_batch(texts, num_threads=min(8, len(texts)))]
+    
     def chunk_text(self, text: str, max_tokens: int = None) -> List[str]:
         """テキストを指定トークン数で分割"""
         if max_tokens is None:
@@ -44,35 +67,114 @@ class EmbeddingService:
             
         return chunks
     
+    def _cache_key(self, text: str) -> str:
+        """(モデル, 正規化テキストのハッシュ) によるキャッシュキー"""
+        digest = hashlib.blake2b(text.strip().encode("utf-8"), digest_size=16).hexdigest()
+        return f"embedding:{self.model}:{digest}"
+    
+    def _get_cached_embeddings(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        キャッシュ済みの埋め込みを取得（未登録・キャッシュ無効時はNone）
+        同期クライアントのため、非同期メソッドからは asyncio.to_thread 経由で呼び出す
+        """
+        if self.cache_client is None or not texts:
+            return [None] * len(texts)
+        try:
+            values = self.cache_client.mget([self._cache_key(text) for text in texts])
+        except redis.RedisError as e:
+            logger.warning(f"埋め込みキャッシュ取得エラー: {e}")
+            return [None] * len(texts)
+        return [
+            np.frombuffer(base64.b64decode(value), dtype=np.float32).tolist() if value is not None else None
+            for value in values
+        ]
+    
+    def _cache_embeddings(self, texts: List[str], embeddings: List[List[float]]):
+        """
+        APIで取得した埋め込みをfloat32のバイト列でキャッシュに保存
+        共有プールは応答を文字列にデコードするため、バイト列はBase64で格納する
+        """
+        if self.cache_client is None or not texts:
+            return
+        try:
+            pipeline = self.cache_client.pipeline(transaction=False)
+            for text, embedding in zip(texts, embeddings):
+                pipeline.setex(
+                    self._cache_key(text),
+                    self.cache_ttl,
+                    base64.b64encode(np.asarray(embedding, dtype=np.float32).tobytes())
+                )
+            pipeline.execute()
+        except redis.RedisError as e:
+            logger.warning(f"埋め込みキャッシュ保存エラー: {e}")
+    
     async def embed_text(self, text: str) -> List[float]:
         """単一テキストのベクトル化"""
+        cached = (await asyncio.to_thread(self._get_cached_embeddings, [text]))[0]
+        if cached is not None:
+            return cached
         try:
             response = await self.client.embeddings.create(
                 model=self.model,
                 input=text
             )
-            return response.data[0].embedding
+            embedding = response.data[0].embedding
         except Exception as e:
             logger.error(f"テキストベクトル化エラー: {e}")
             raise
+        await asyncio.to_thread(self._cache_embeddings, [text], [embedding])
+        return embedding
     
     async def embed_texts_batch(self, texts: List[str]) -> List[List[float]]:
-        """複数テキストのバッチベクトル化"""
+        """複数テキストのバッチベクトル化（キャッシュに無いテキストのみAPIに送信）"""
+        embeddings = await asyncio.to_thread(self._get_cached_embeddings, texts)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if not missing:
+            return embeddings
+        
+        missing_texts = [texts[i] for i in missing]
         try:
             response = await self.client.embeddings.create(
                 model=self.model,
-                input=texts
+                input=missing_texts
             )
-            return [data.embedding for data in response.data]
         except Exception as e:
             logger.error(f"バッチベクトル化エラー: {e}")
             raise
+        
+        fetched = [data.embedding for data in response.data]
+        for i, embedding in zip(missing, fetched):
+            embeddings[i] = embedding
+        await asyncio.to_thread(self._cache_embeddings, missing_texts, fetched)
+        return embeddings
+    
+    async def embed_texts(
+        self,
+        texts: List[str],
+        token_counts: Optional[List[int]] = None
+    ) -> np.ndarray:
+        """
+        分割済みテキストをベクトル化し、入力と同じ順序の (件数, EMBEDDING_DIMENSIONS) float32 行列を返す
+        
+        バッチ内のトークン数を揃えるためトークン数順に並べ替えて送信し、
+        結果は事前確保した行列の元の行位置へ直接書き込む。失敗したテキストの行は NaN になる
+        
+        Args:
+            texts: ベクトル化するテキストのリスト
+            token_counts: 算出済みのトークン数（省略時は encode_batch で算出する）
+        """
+        if token_counts is None:
+            token_counts = self.count_tokens_batch(texts)
+        order = np.argsort(np.asarray(token_counts, dtype=np.int64), kind='stable')
+        embeddings = np.empty((len(texts), settings.EMBEDDING_DIMENSIONS), dtype=np.float32)
+        await self._process_chunks_in_batches([texts[i] for i in order], embeddings, order)
+        return embeddings
     
     async def embed_texts_with_chunking(
         self, 
         texts: List[str],
         include_metadata: bool = True
-    ) -> List[Dict[str, Any]]:
+    ) -> Dict[str, Any]:
         """
         長文テキストをチャンク分割してベクトル化
         
@@ -81,96 +183,131 @@ class EmbeddingService:
             include_metadata: メタデータを含めるかどうか
             
         Returns:
-            [
-                {
-                    'text': 'チャンクテキスト',
-                    'embedding': [0.1, 0.2, ...],
-                    'metadata': {
+            {
+                'texts': ['チャンクテキスト', ...],
+                'embeddings': np.ndarray (n_chunks, EMBEDDING_DIMENSIONS) float32,
+                'metadata': [
+                    {
                         'original_index': 0,
                         'chunk_index': 0,
                         'total_chunks': 3,
                         'token_count': 256
-                    }
-                },
-                ...
-            ]
+                    },
+                    ...
+                ]  # include_metadata=False の場合は空リスト
+            }
         """
         all_chunks = []
+        chunk_token_counts = []
         chunk_metadata = []
         
-        # 1. 全テキストをチャンク分割
-        for text_idx, text in enumerate(texts):
-            token_count = self.count_tokens(text)
-            
-            if token_count <= self.max_tokens:
-                # トークン数が制限以下の場合はそのまま使用
-                all_chunks.append(text)
+        # 1. 全テキストをチャンク分割（encode_batch で全テキストを一度にトークン化する）
+        token_lists = (
+            self.encoding.encode_batch(texts, num_threads=min(8, len(texts))) if texts else []
+        )
+        for text_idx, (text, tokens) in enumerate(zip(texts, token_lists)):
+            # トークン列をスライスしてデコードするため再エンコード不要
+            starts = range(0, max(len(tokens), 1), self.max_tokens)
+            for chunk_idx, start in enumerate(starts):
+                chunk_tokens = tokens[start:start + self.max_tokens]
+                all_chunks.append(text if len(starts) == 1 else self.encoding.decode(chunk_tokens))
+                chunk_token_counts.append(len(chunk_tokens))
                 if include_metadata:
                     chunk_metadata.append({
                         'original_index': text_idx,
-                        'chunk_index': 0,
-                        'total_chunks': 1,
-                        'token_count': token_count
+                        'chunk_index': chunk_idx,
+                        'total_chunks': len(starts),
+                        'token_count': len(chunk_tokens)
                     })
-            else:
-                # チャンク分割が必要
-                chunks = self.chunk_text(text)
-                all_chunks.extend(chunks)
-                
-                if include_metadata:
-                    for chunk_idx, chunk in enumerate(chunks):
-                        chunk_metadata.append({
-                            'original_index': text_idx,
-                            'chunk_index': chunk_idx,
-                            'total_chunks': len(chunks),
-                            'token_count': self.count_tokens(chunk)
-                        })
         
         # 2. バッチ処理でベクトル化
-        embeddings = await self._process_chunks_in_batches(all_chunks)
+        embeddings = await self.embed_texts(all_chunks, chunk_token_counts)
         
-        # 3. 結果の構築
-        results = []
-        for i, (chunk, embedding) in enumerate(zip(all_chunks, embeddings)):
-            result = {
-                'text': chunk,
-                'embedding': embedding
-            }
-            if include_metadata and i < len(chunk_metadata):
-                result['metadata'] = chunk_metadata[i]
-            results.append(result)
-        
-        return results
+        # ベクトル化に失敗したチャンク（NaN行）は結果から除外する
+        succeeded = ~np.isnan(embeddings[:, 0])
+        if not succeeded.all():
+            logger.warning(f"ベクトル化に失敗したチャンクを除外: {int((~succeeded).sum())}件")
+            embeddings = embeddings[succeeded]
+            all_chunks = [chunk for chunk, ok in zip(all_chunks, succeeded) if ok]
+            if include_metadata:
+                chunk_metadata = [meta for meta, ok in zip(chunk_metadata, succeeded) if ok]
+
+        # 3. 結果の構築（行ごとの dict は作らず、行列とメタデータを並列に返す）
+        return {
+            'texts': all_chunks,
+            'embeddings': embeddings,
+            'metadata': chunk_metadata
+        }
     
-    async def _process_chunks_in_batches(self, chunks: List[str]) -> List[List[float]]:
-        """チャンクをバッチ処理でベクトル化"""
-        all_embeddings = []
-        
-        for i in range(0, len(chunks), self.batch_size):
-            batch = chunks[i:i + self.batch_size]
-            
+    async def _embed_with_retry(self, texts: List[str]) -> List[List[float]]:
+        """レート制限（429）時は指数バックオフ＋ジッターで再試行するバッチベクトル化"""
+        for attempt in range(self.max_retries):
             try:
-                batch_embeddings = await self.embed_texts_batch(batch)
-                all_embeddings.extend(batch_embeddings)
-                
-                # API制限を考慮して少し待機
-                if i + self.batch_size < len(chunks):
-                    await asyncio.sleep(0.1)
-                    
+                return await self.embed_texts_batch(texts)
+            except openai.RateLimitError:
+                if attempt == self.max_retries - 1:
+                    raise
+                await asyncio.sleep(min(2 ** attempt, 30) * (0.5 + random.random()))
+    
+    async def _embed_batch_with_fallback(
+        self,
+        batch_number: int,
+        batch: List[str],
+        semaphore: asyncio.Semaphore
+    ) -> List[Optional[List[float]]]:
+        """1バッチ分のベクトル化（失敗時は個別処理にフォールバック）"""
+        async with semaphore:
+            try:
+                return await self._embed_with_retry(batch)
             except Exception as e:
-                logger.error(f"バッチ {i//self.batch_size + 1} の処理エラー: {e}")
-                # エラー時は個別処理にフォールバック
-                for chunk in batch:
-                    try:
-                        embedding = await self.embed_text(chunk)
-                        all_embeddings.append(embedding)
-                        await asyncio.sleep(0.05)
-                    except Exception as chunk_error:
-                        logger.error(f"個別チャンク処理エラー: {chunk_error}")
-                        # エラー時はゼロベクトルで代替
-                        all_embeddings.append([0.0] * 1536)
+                logger.error(f"バッチ {batch_number} の処理エラー: {e}")
+            
+            # エラー時は個別処理にフォールバック
+            embeddings = []
+            for chunk in batch:
+                try:
+                    embeddings.append(await self.embed_text(chunk))
+                except Exception as chunk_error:
+                    logger.error(f"個別チャンク処理エラー: {chunk_error}")
+                    # エラー時は None を返し、呼び出し側で除外する（ゼロベクトルを混入させない）
+                    embeddings.append(None)
+            return embeddings
+    
+    async def _process_chunks_in_batches(
+        self,
+        chunks: List[str],
+        out: np.ndarray,
+        rows: np.ndarray
+    ) -> np.ndarray:
+        """
+        チャンクをバッチに分け、同時実行数を制限しながら並行してベクトル化
+        各バッチの結果は out の rows[i] 行目（i はチャンクの位置）へ直接書き込む（失敗した行は NaN）
+        """
+        # セマフォはイベントループごとに作成する（ワーカープロセスでは asyncio.run が繰り返されるため）
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        batch_results = await asyncio.gather(*(
+            self._embed_batch_with_fallback(i // self.batch_size + 1, chunks[i:i + self.batch_size], semaphore)
+            for i in range(0, len(chunks), self.batch_size)
+        ))
         
-        return all_embeddings
+        # gather は入力順に結果を返すため、先頭から順に rows の位置へ書き込めばよい
+        offset = 0
+        for batch_embeddings in batch_results:
+            end = offset + len(batch_embeddings)
+            target = rows[offset:end]
+            failed = [j for j, embedding in enumerate(batch_embeddings) if embedding is None]
+            if failed:
+                out[target[failed]] = np.nan
+                valid = np.delete(target, failed)
+                if len(valid):
+                    out[valid] = np.asarray(
+                        [embedding for embedding in batch_embeddings if embedding is not None],
+                        dtype=np.float32
+                    )
+            else:
+                out[target] = np.asarray(batch_embeddings, dtype=np.float32)
+            offset = end
+        return out
     
     async def embed_conversation_for_search(
         self, 
@@ -182,10 +319,10 @@ class EmbeddingService:
         保存はせず、検索クエリとして使用
         """
         try:
-            # 長文の場合は最初のチャンクのみ使用
-            if self.count_tokens(conversation_text) > self.max_tokens:
-                chunks = self.chunk_text(conversation_text, self.max_tokens)
-                search_text = chunks[0]  # 最初のチャンクを代表として使用
+            # 長文の場合は最初のチャンクのみ使用（トークン化は一度だけ行い、先頭をデコードする）
+            tokens = self.encoding.encode(conversation_text)
+            if len(tokens) > self.max_tokens:
+                search_text = self.encoding.decode(tokens[:self.max_tokens])  # 最初のチャンクを代表として使用
             else:
                 search_text = conversation_text
                 
@@ -202,6 +339,9 @@ class EmbeddingService:
 class TextChunkingService:
     """テキスト分割専用サービス"""
     
+    # 改行や句読点で分割
+    _SPLIT_RE = re.compile(r'[。！？\n]+')
+    
     def __init__(self):
         self.encoding = tiktoken.get_encoding("cl100k_base")
     
@@ -217,32 +357,32 @@ class TextChunkingService:
         """
         # 簡単な発話分割（カウンセラー/顧客の発話境界で分割）
         sentences = self._split_by_speaker_turns(conversation_text)
+        # 全発話をまとめて一度にトークン化する
+        sentence_token_counts = [len(tokens) for tokens in self.encoding.encode_batch(sentences)]
         
         chunks = []
-        current_chunk = ""
+        current_chunk: List[str] = []
         current_tokens = 0
         
-        for sentence in sentences:
-            sentence_tokens = len(self.encoding.encode(sentence))
-            
+        for sentence, sentence_tokens in zip(sentences, sentence_token_counts):
             if current_tokens + sentence_tokens <= max_tokens:
-                current_chunk += sentence + " "
+                current_chunk.append(sentence)
                 current_tokens += sentence_tokens
             else:
                 if current_chunk:
                     chunks.append({
-                        'text': current_chunk.strip(),
+                        'text': " ".join(current_chunk),
                         'token_count': current_tokens
                     })
                 
                 # 新しいチャンクを開始
-                current_chunk = sentence + " "
+                current_chunk = [sentence]
                 current_tokens = sentence_tokens
         
         # 最後のチャンクを追加
         if current_chunk:
             chunks.append({
-                'text': current_chunk.strip(),
+                'text': " ".join(current_chunk),
                 'token_count': current_tokens
             })
         
@@ -251,10 +391,7 @@ class TextChunkingService:
     def _split_by_speaker_turns(self, text: str) -> List[str]:
         """発話ターンで分割（簡易版）"""
         # 実際の実装では、より高度な発話分割ロジックを使用
-        import re
-        
-        # 改行や句読点で分割
-        sentences = re.split(r'[。！？\n]+', text)
+        sentences = self._SPLIT_RE.split(text)
         return [s.strip() for s in sentences if s.strip()]
 
 
@@ -3,6 +3,7 @@
 GPT-4o用の最適化されたプロンプトを自動生成
 """
 import logging
+from functools import lru_cache
 from typing import List, Dict, Any, Optional, Tuple
 import tiktoken
 from datetime import datetime
@@ -14,11 +15,18 @@ from app.core.config import settings
 logger = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=1)
+def _get_encoding() -> tiktoken.Encoding:
+    """cl100k_base のエンコーダをプロセス内で1つだけ生成して共有する"""
+    return tiktoken.get_encoding("cl100k_base")
+
+
 class HighQualityPromptBuilder:
     """GPT-4o用高品質プロンプト構築サービス"""
     
     def __init__(self):
-        self.encoding = tiktoken.get_encoding("cl100k_base")
+        # ビルダーはリクエストごとに生成されるため、エンコーダは共有インスタンスを使う
+        self.encoding = _get_encoding()
         self.max_prompt_tokens = 15000  # GPT-4oのコンテキスト制限を考慮
         self.target_completion_tokens = 4000  # 生成スクリプトの想定トークン数
         
@@ -64,23 +72,30 @@ class HighQualityPromptBuilder:
             
             # 初期プロンプト組み立て
             initial_prompt = self._assemble_prompt(sections)
-            initial_token_count = self._count_tokens(initial_prompt)
+            # 各セクションと組み立て後のプロンプトを1回のバッチでトークン化する
+            *section_token_lists, prompt_tokens = self._encode_batch(
+                [*sections.values(), initial_prompt]
+            )
+            section_tokens = dict(zip(sections.keys(), section_token_lists))
+            section_token_counts = {section: len(tokens) for section, tokens in section_tokens.items()}
+            initial_token_count = len(prompt_tokens)
             
             # トークン数最適化
             if initial_token_count > self.max_prompt_tokens:
                 logger.info(f"プロンプト最適化実行: {initial_token_count} -> 目標{self.max_prompt_tokens}")
                 optimized_sections = self._optimize_prompt_sections(
                     sections, 
-                    target_tokens=self.max_prompt_tokens
+                    target_tokens=self.max_prompt_tokens,
+                    section_tokens=section_tokens
                 )
                 final_prompt = self._assemble_prompt(optimized_sections)
+                final_token_count = self._count_tokens(final_prompt)
                 optimization_applied = True
             else:
                 final_prompt = initial_prompt
+                final_token_count = initial_token_count
                 optimization_applied = False
             
-            final_token_count = self._count_tokens(final_prompt)
-            
             return {
                 'prompt': final_prompt,
                 'metadata': {
@@ -88,7 +103,7 @@ class HighQualityPromptBuilder:
                     'initial_token_count': initial_token_count,
                     'optimization_applied': optimization_applied,
                     'cost_reduction_rate': (initial_token_count - final_token_count) / initial_token_count if optimization_applied else 0,
-                    'sections': {section: self._count_tokens(content) for section, content in sections.items()},
+                    'sections': section_token_counts,
                     'created_at': datetime.utcnow().isoformat()
                 }
             }
@@ -334,9 +349,14 @@ class HighQualityPromptBuilder:
     def _optimize_prompt_sections(
         self, 
         sections: Dict[str, str], 
-        target_tokens: int
+        target_tokens: int,
+        section_tokens: Optional[Dict[str, List[int]]] = None
     ) -> Dict[str, str]:
-        """プロンプトセクションのトークン数最適化"""
+        """
+        プロンプトセクションのトークン数最適化
+        各セクションは一度だけトークン化し、トークン列のスライスで切り詰めて最後に1回だけデコードする
+        section_tokens に計算済みのトークン列を渡すとエンコード自体を省略する
+        """
         
         # 各セクションの重要度（削減優先度：低い順）
         importance_order = [
@@ -348,20 +368,24 @@ class HighQualityPromptBuilder:
             'system'              # 6. システム（最重要）
         ]
         
-        current_tokens = sum(self._count_tokens(content) for content in sections.values())
+        if section_tokens is None:
+            section_tokens = dict(zip(sections.keys(), self._encode_batch(list(sections.values()))))
+        section_tokens = dict(section_tokens)
+        current_tokens = sum(len(tokens) for tokens in section_tokens.values())
         target_reduction = current_tokens - target_tokens
         
         if target_reduction <= 0:
             return sections
         
-        optimized_sections = sections.copy()
+        truncated_sections = set()
+        new_total = current_tokens
         
         # 段階的に最適化
         for section_name in importance_order:
-            if section_name not in optimized_sections:
+            if section_name not in section_tokens:
                 continue
                 
-            current_section_tokens = self._count_tokens(optimized_sections[section_name])
+            current_section_tokens = len(section_tokens[section_name])
             
             # セクションごとの削減率を調整
             if section_name == 'constraints':
@@ -375,30 +399,29 @@ class HighQualityPromptBuilder:
             
             target_section_tokens = int(current_section_tokens * (1 - reduction_rate))
             
-            optimized_sections[section_name] = self._truncate_to_token_limit(
-                optimized_sections[section_name], 
-                target_section_tokens
-            )
+            section_tokens[section_name] = section_tokens[section_name][:target_section_tokens]
+            truncated_sections.add(section_name)
             
-            # 目標に達したかチェック
-            new_total = sum(self._count_tokens(content) for content in optimized_sections.values())
+            # 目標に達したかチェック（削った分だけ合計を減らす）
+            new_total -= current_section_tokens - target_section_tokens
             if new_total <= target_tokens:
                 break
         
+        # 切り詰めたセクションのみデコードする
+        optimized_sections = sections.copy()
+        for section_name in truncated_sections:
+            optimized_sections[section_name] = self.encoding.decode(section_tokens[section_name])
         return optimized_sections
     
     def _count_tokens(self, text: str) -> int:
-        """テキストのトークン数をカウント"""
-        return len(self.encoding.encode(text))
+        """テキストのトークン数をカウント（_encode_batch と同じく特殊トークンも通常のテキストとして扱う）"""
+        return len(self.encoding.encode_ordinary(text))
     
-    def _truncate_to_token_limit(self, text: str, max_tokens: int) -> str:
-        """指定トークン数に切り詰め"""
-        tokens = self.encoding.encode(text)
-        if len(tokens) <= max_tokens:
-            return text
-        
-        truncated_tokens = tokens[:max_tokens]
-        return self.encoding.decode(truncated_tokens)
+    def _encode_batch(self, texts: List[str]) -> List[List[int]]:
+        """複数テキストを1回のバッチ呼び出しでトークン化"""
+        if not texts:
+            return []
+        return self.encoding.encode_ordinary_batch(texts, num_threads=min(8, len(texts)))
     
     def _truncate_text(self, text: str, max_length: int) -> str:
         """テキストを指定文字数で切り詰め"""
@@ -418,16 +441,11 @@ class HighQualityPromptBuilder:
         return "\n".join(formatted_hints)
 
 
-class PromptTemplateManager:
-    """プロンプトテンプレート管理"""
-    
-    def __init__(self):
-        self.templates = self._load_default_templates()
-    
-    def _load_default_templates(self) -> Dict[str, str]:
-        """デフォルトテンプレートを読み込み"""
-        return {
-            'basic_script_generation': """
+@lru_cache(maxsize=1)
+def _load_default_templates() -> Dict[str, str]:
+    """デフォルトテンプレート定義"""
+    return {
+        'basic_script_generation': """
 # カウンセリングスクリプト改善タスク
 
 あなたは美容脱毛業界の専門カウンセラーとして、以下の成功・失敗事例を分析し、改善スクリプトを生成してください。
@@ -440,7 +458,7 @@ class PromptTemplateManager:
 
 {constraints}
 """,
-            'focused_improvement': """
+        'focused_improvement': """
 # 特定領域集中改善タスク
 
 以下の{focus_area}に特化した改善スクリプトを生成してください。
@@ -449,7 +467,7 @@ class PromptTemplateManager:
 
 {specific_requirements}
 """,
-            'rapid_optimization': """
+        'rapid_optimization': """
 # 高速最適化タスク
 
 成約率向上に直結する即効性の高い改善ポイントを特定し、実用的なスクリプトを生成してください。
@@ -458,7 +476,18 @@ class PromptTemplateManager:
 
 {improvement_targets}
 """
-        }
+    }
+
+
+class PromptTemplateManager:
+    """プロンプトテンプレート管理"""
+    
+    def __init__(self):
+        self.templates = self._load_default_templates()
+    
+    def _load_default_templates(self) -> Dict[str, str]:
+        """デフォルトテンプレートを読み込み（読み込み結果はマネージャー間で共有し、辞書のみ複製）"""
+        return dict(_load_default_templates())
     
     def get_template(self, template_name: str) -> str:
         """テンプレートを取得"""
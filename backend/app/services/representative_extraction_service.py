@@ -2,7 +2,8 @@
 クラスタ代表例抽出サービス
 """
 import logging
-from typing import List, Dict, Any, Optional
+import re
+from typing import List, Dict, Any, Optional, Tuple
 import numpy as np
 from sqlalchemy.orm import Session
 from sqlalchemy import and_
@@ -22,6 +23,29 @@ from app.services.embedding_service import embedding_service
 logger = logging.getLogger(__name__)
 
 
+def _keyword_pattern(keywords: List[str]) -> "re.Pattern[str]":
+    """キーワード群を1本の正規表現にまとめる（長いキーワードを優先）"""
+    return re.compile("|".join(map(re.escape, sorted(keywords, key=len, reverse=True))))
+
+
+# 美容脱毛業界の重要キーワード
+IMPORTANT_KEYWORD_PATTERN = _keyword_pattern([
+    '効果', '料金', '安心', '体験', '相談', '無料', 'カウンセリング',
+    '脱毛', '痛み', '期間', '回数', '保証', '技術', '安全'
+])
+
+# ポジティブキーワード
+POSITIVE_KEYWORD_PATTERN = _keyword_pattern([
+    '満足', '安心', '効果的', '快適', '信頼', '安全', '丁寧',
+    '親切', '分かりやすい', 'おすすめ'
+])
+
+# ネガティブキーワード（減点要素）
+NEGATIVE_KEYWORD_PATTERN = _keyword_pattern([
+    '痛い', '高い', '不安', '心配', '迷う', '悩む'
+])
+
+
 class RepresentativeExtractionService:
     """クラスタ代表例抽出サービス"""
     
@@ -82,16 +106,28 @@ class RepresentativeExtractionService:
             cluster_representatives = []
             total_quality_scores = []
             
-            # クラスタごとに処理
-            unique_labels = self.db.query(ClusterAssignment.cluster_label).filter(
+            # 全クラスタの割り当てとベクトルを1クエリで取得し、クラスタごとにまとめる
+            assignments_with_vectors = self.db.query(
+                ClusterAssignment,
+                SuccessConversationVector
+            ).join(
+                SuccessConversationVector, ClusterAssignment.vector_id == SuccessConversationVector.id
+            ).filter(
                 ClusterAssignment.cluster_result_id == cluster_result_id,
                 ClusterAssignment.cluster_label >= 0  # ノイズ(-1)を除外
-            ).distinct().all()
+            ).all()
+            
+            cluster_groups = {}
+            for assignment, vector in assignments_with_vectors:
+                cluster_groups.setdefault(assignment.cluster_label, []).append((assignment, vector))
+            
+            # 新規性スコア用の既存代表例も一度だけ取得
+            existing_representatives = self._load_primary_representative_vectors()
             
-            for (cluster_label,) in unique_labels:
+            for cluster_label, cluster_vectors in cluster_groups.items():
                 representatives = await self._extract_representatives_for_cluster(
-                    cluster_result_id=cluster_result_id,
-                    cluster_label=cluster_label,
+                    cluster_vectors=cluster_vectors,
+                    existing_representatives=existing_representatives,
                     max_representatives=max_representatives_per_cluster,
                     min_quality_score=min_quality_score
                 )
@@ -128,26 +164,23 @@ class RepresentativeExtractionService:
             logger.error(f"代表例抽出エラー: {e}")
             raise
     
+    def _load_primary_representative_vectors(self) -> List[SuccessConversationVector]:
+        """既存のプライマリ代表例のベクトルを取得"""
+        return self.db.query(SuccessConversationVector).join(
+            ClusterRepresentative, ClusterRepresentative.vector_id == SuccessConversationVector.id
+        ).filter(
+            ClusterRepresentative.is_primary == True
+        ).all()
+    
     async def _extract_representatives_for_cluster(
         self,
-        cluster_result_id: str,
-        cluster_label: int,
+        cluster_vectors: List[Tuple[ClusterAssignment, SuccessConversationVector]],
+        existing_representatives: List[SuccessConversationVector],
         max_representatives: int,
         min_quality_score: float
     ) -> List[Dict[str, Any]]:
         """特定クラスタの代表例を抽出"""
         
-        # クラスタ内のベクトルを取得
-        cluster_vectors = self.db.query(
-            ClusterAssignment,
-            SuccessConversationVector
-        ).join(
-            SuccessConversationVector, ClusterAssignment.vector_id == SuccessConversationVector.id
-        ).filter(
-            ClusterAssignment.cluster_result_id == cluster_result_id,
-            ClusterAssignment.cluster_label == cluster_label
-        ).all()
-        
         if not cluster_vectors:
             return []
         
@@ -156,7 +189,8 @@ class RepresentativeExtractionService:
         for assignment, vector in cluster_vectors:
             quality_score = await self._calculate_quality_score(
                 vector=vector,
-                distance_to_centroid=assignment.distance_to_centroid
+                distance_to_centroid=assignment.distance_to_centroid,
+                existing_representatives=existing_representatives
             )
             
             if quality_score >= min_quality_score:
@@ -193,7 +227,8 @@ class RepresentativeExtractionService:
     async def _calculate_quality_score(
         self,
         vector: SuccessConversationVector,
-        distance_to_centroid: Optional[float]
+        distance_to_centroid: Optional[float],
+        existing_representatives: List[SuccessConversationVector]
     ) -> float:
         """代表例の品質スコアを算出"""
         
@@ -212,12 +247,12 @@ class RepresentativeExtractionService:
         score_components['success_rate'] = success_score
         
         # 3. テキスト長さスコア（適切な長さ）
-        text_length = len(vector.chunk_text)
+        text_length = vector.text_length
         length_score = self._calculate_length_score(text_length)
         score_components['text_length'] = length_score
         
         # 4. 新規性スコア（他の代表例との差分）
-        novelty_score = await self._calculate_novelty_score(vector)
+        novelty_score = await self._calculate_novelty_score(vector, existing_representatives)
         score_components['novelty'] = novelty_score
         
         # 5. コンテンツ品質スコア（キーワード密度など）
@@ -254,28 +289,24 @@ class RepresentativeExtractionService:
             excess_penalty = min(0.7, (text_length - ideal_max) / ideal_max)
             return max(0.3, 1.0 - excess_penalty)
     
-    async def _calculate_novelty_score(self, target_vector: SuccessConversationVector) -> float:
+    async def _calculate_novelty_score(
+        self,
+        target_vector: SuccessConversationVector,
+        existing_representatives: List[SuccessConversationVector]
+    ) -> float:
         """新規性スコア計算（既存代表例との類似度から算出）"""
         
-        # 既存の代表例を取得
-        existing_representatives = self.db.query(
-            ClusterRepresentative, SuccessConversationVector
-        ).join(
-            SuccessConversationVector, ClusterRepresentative.vector_id == SuccessConversationVector.id
-        ).filter(
-            ClusterRepresentative.is_primary == True
-        ).all()
-        
         if not existing_representatives:
             return 1.0  # 既存代表例がない場合は最高スコア
         
         # 各既存代表例との類似度を計算
         similarities = []
-        target_embedding = np.array(target_vector.embedding)
+        # 埋め込みは float32 の ndarray で読み出されるため、コピーや float64 への昇格はしない
+        target_embedding = np.asarray(target_vector.embedding, dtype=np.float32)
         
-        for rep, vector in existing_representatives:
+        for vector in existing_representatives:
             if vector.id != target_vector.id:  # 自分自身を除外
-                existing_embedding = np.array(vector.embedding)
+                existing_embedding = np.asarray(vector.embedding, dtype=np.float32)
                 
                 # コサイン類似度計算
                 similarity = np.dot(target_embedding, existing_embedding) / (
@@ -295,29 +326,10 @@ class RepresentativeExtractionService:
     def _calculate_content_quality_score(self, text: str) -> float:
         """コンテンツ品質スコア計算"""
         
-        # 美容脱毛業界の重要キーワード
-        important_keywords = [
-            '効果', '料金', '安心', '体験', '相談', '無料', 'カウンセリング',
-            '脱毛', '痛み', '期間', '回数', '保証', '技術', '安全'
-        ]
-        
-        # ポジティブキーワード
-        positive_keywords = [
-            '満足', '安心', '効果的', '快適', '信頼', '安全', '丁寧',
-            '親切', '分かりやすい', 'おすすめ'
-        ]
-        
-        # ネガティブキーワード（減点要素）
-        negative_keywords = [
-            '痛い', '高い', '不安', '心配', '迷う', '悩む'
-        ]
-        
-        text_lower = text.lower()
-        
-        # キーワード密度計算
-        important_count = sum(keyword in text for keyword in important_keywords)
-        positive_count = sum(keyword in text for keyword in positive_keywords)
-        negative_count = sum(keyword in text for keyword in negative_keywords)
+        # キーワード密度計算（出現したキーワードの種類数。各グループ1回の走査で数える）
+        important_count = len(set(IMPORTANT_KEYWORD_PATTERN.findall(text)))
+        positive_count = len(set(POSITIVE_KEYWORD_PATTERN.findall(text)))
+        negative_count = len(set(NEGATIVE_KEYWORD_PATTERN.findall(text)))
         
         # 文字数で正規化
         text_length = len(text)
@@ -425,30 +437,19 @@ class RepresentativeExtractionService:
                         'counselor_name': vector.counselor_name,
                         'created_at': vector.created_at
                     },
-                    'cluster_characteristics': await self._analyze_cluster_characteristics(
-                        cluster_result_id, cluster_label
+                    'cluster_characteristics': self._analyze_cluster_characteristics(
+                        [vector for _, vector in group]
                     )
                 })
         
         # Limit to max_total_representatives
         return selected_representatives[:max_total_representatives]
     
-    async def _analyze_cluster_characteristics(
+    def _analyze_cluster_characteristics(
         self,
-        cluster_result_id: str,
-        cluster_label: int
+        cluster_vectors: List[SuccessConversationVector]
     ) -> Dict[str, Any]:
-        """クラスタの特徴分析"""
-        
-        # クラスタ内の全ベクトルを取得
-        cluster_vectors = self.db.query(
-            SuccessConversationVector
-        ).join(
-            ClusterAssignment, ClusterAssignment.vector_id == SuccessConversationVector.id
-        ).filter(
-            ClusterAssignment.cluster_result_id == cluster_result_id,
-            ClusterAssignment.cluster_label == cluster_label
-        ).all()
+        """クラスタの特徴分析（取得済みのクラスタ内ベクトルを使用）"""
         
         if not cluster_vectors:
             return {}
@@ -119,8 +119,8 @@ class ScriptGenerationService:
         # 代表例取得
         # ベクトルDBセッションがない場合は新しく作成
         if self.vector_db is None:
-            from app.core.database import get_vector_database
-            vector_db_session = next(get_vector_database())
+            from app.db.session import get_vector_db
+            vector_db_session = next(get_vector_db())
         else:
             vector_db_session = self.vector_db
         
@@ -130,19 +130,26 @@ class ScriptGenerationService:
             max_total_representatives=8
         )
         
-        # 失敗→成功マッピング生成
+        # 失敗→成功マッピング生成（各失敗会話のベクトル化は独立しているため並行実行）
         failure_mappings = []
         if failure_conversations:
             search_service = create_vector_search_service(vector_db_session)
+            # OpenAI のレート制限に配慮して同時実行数を制限
+            semaphore = asyncio.Semaphore(5)
             
-            for failure in failure_conversations:
-                mapping = await search_service.search_similar_for_failure_conversation(
-                    failure_conversation_text=failure['text'],
-                    top_k=3,
-                    similarity_threshold=0.7,
-                    include_analysis=True
-                )
-                failure_mappings.append(mapping)
+            async def map_failure(failure: Dict[str, Any]) -> Dict[str, Any]:
+                async with semaphore:
+                    return await search_service.search_similar_for_failure_conversation(
+                        failure_conversation_text=failure['text'],
+                        top_k=3,
+                        similarity_threshold=0.7,
+                        include_analysis=True
+                    )
+            
+            # gather は入力順に結果を返すため、マッピングの順序は従来と同じ
+            failure_mappings = list(await asyncio.gather(
+                *(map_failure(failure) for failure in failure_conversations)
+            ))
         
         return {
             'representatives': representatives,
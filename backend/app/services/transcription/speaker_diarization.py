@@ -1,6 +1,10 @@
 from typing import List, Dict, Optional
 import re
 
+# Compiled once at import instead of going through re's cache on every segment
+QUESTION_PATTERN = re.compile(r'[。！？].*ですか[。！？]?')
+EXPLANATORY_PATTERN = re.compile(r'ので|から|ため')
+
 class SpeakerDiarizationService:
     """
     Simple rule-based speaker diarization for counseling sessions
@@ -21,6 +25,13 @@ class SpeakerDiarizationService:
             "わからない", "つらい", "悲しい", "嬉しい", "ありがとう"
         ]
 
+    def warmup(self):
+        """
+        Run one dummy segment through the pipeline so the first real
+        request doesn't pay for first-call setup
+        """
+        self.assign_speakers([{"text": "今日はどのようなご相談ですか？", "start": 0, "end": 1}])
+
     def assign_speakers(self, segments: List[Dict]) -> List[Dict]:
         """
         Assign speakers to transcription segments
@@ -67,10 +78,10 @@ class SpeakerDiarizationService:
                 client_score += 2
         
         # Additional rules
-        if re.search(r'[。！？].*ですか[。！？]?', text):  # Questions
+        if QUESTION_PATTERN.search(text):  # Questions
             counselor_score += 1
         
-        if re.search(r'ので|から|ため', text):  # Explanatory patterns
+        if EXPLANATORY_PATTERN.search(text):  # Explanatory patterns
             client_score += 1
         
         # If first segment or no clear indicator, use heuristics
@@ -10,6 +10,9 @@ class WhisperService:
     def __init__(self):
         openai.api_key = settings.OPENAI_API_KEY
         self.client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
+        self.async_client = openai.AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+        # Shared async HTTP client so S3 downloads reuse connections
+        self.http_client = httpx.AsyncClient(timeout=300.0)  # 5 minutes timeout
 
     def transcribe_audio(
         self,
@@ -40,36 +43,7 @@ class WhisperService:
                         language=language
                     )
                 
-                # Process response
-                transcription_result = {
-                    "session_id": session_id,
-                    "full_text": response.text,
-                    "language": response.language,
-                    "duration": response.duration if hasattr(response, 'duration') else None,
-                    "segments": []
-                }
-                
-                # Process segments with timestamps
-                if hasattr(response, 'segments') and response.segments:
-                    for i, segment in enumerate(response.segments):
-                        transcription_result["segments"].append({
-                            "id": i,
-                            "start": getattr(segment, 'start', 0),
-                            "end": getattr(segment, 'end', 0),
-                            "text": getattr(segment, 'text', '').strip(),
-                            "speaker": None  # Will be filled by speaker diarization
-                        })
-                else:
-                    # If no segments available, create a single segment with full text
-                    transcription_result["segments"].append({
-                        "id": 0,
-                        "start": 0,
-                        "end": transcription_result.get("duration", 0) or 0,
-                        "text": response.text.strip(),
-                        "speaker": None
-                    })
-                
-                return transcription_result
+                return self._build_result(response, session_id)
                 
             finally:
                 # Clean up temporary file
@@ -79,6 +53,75 @@ class WhisperService:
         except Exception as e:
             raise Exception(f"Transcription failed: {str(e)}")
 
+    async def transcribe_async(
+        self,
+        audio_file_url: str,
+        session_id: str,
+        language: str = "ja"
+    ) -> Dict:
+        """
+        Transcribe audio without blocking the event loop: the S3 download and
+        the Whisper upload both run on async clients and the audio never
+        touches disk
+        """
+        try:
+            response = await self.http_client.get(audio_file_url)
+            response.raise_for_status()
+        except Exception as e:
+            raise Exception(f"Failed to download audio file: {str(e)}") from e
+        
+        try:
+            whisper_response = await self.async_client.audio.transcriptions.create(
+                model="whisper-1",
+                file=("audio.webm", response.content),
+                response_format="verbose_json",
+                language=language
+            )
+            return self._build_result(whisper_response, session_id)
+        except Exception as e:
+            raise Exception(f"Transcription failed: {str(e)}") from e
+
+    async def aclose(self) -> None:
+        """
+        Close the shared async HTTP and OpenAI clients
+        """
+        await self.http_client.aclose()
+        await self.async_client.close()
+
+    def _build_result(self, response, session_id: str) -> Dict:
+        """
+        Convert a verbose_json Whisper response into our transcription dict
+        """
+        transcription_result = {
+            "session_id": session_id,
+            "full_text": response.text,
+            "language": response.language,
+            "duration": response.duration if hasattr(response, 'duration') else None,
+            "segments": []
+        }
+        
+        # Process segments with timestamps
+        if hasattr(response, 'segments') and response.segments:
+            for i, segment in enumerate(response.segments):
+                transcription_result["segments"].append({
+                    "id": i,
+                    "start": getattr(segment, 'start', 0),
+                    "end": getattr(segment, 'end', 0),
+                    "text": getattr(segment, 'text', '').strip(),
+                    "speaker": None  # Will be filled by speaker diarization
+                })
+        else:
+            # If no segments available, create a single segment with full text
+            transcription_result["segments"].append({
+                "id": 0,
+                "start": 0,
+                "end": transcription_result.get("duration", 0) or 0,
+                "text": response.text.strip(),
+                "speaker": None
+            })
+        
+        return transcription_result
+
     def _download_audio_file(self, audio_url: str) -> bytes:
         """
         Download audio file from S3 URL
@@ -11,10 +11,12 @@ from sqlalchemy import text
 import logging
 
 from app.core.config import settings
+from app.db.cache import get_redis_pool
 from app.database import get_db
 
 logger = logging.getLogger(__name__)
 
+
 class VectorSearchOptimizationService:
     """
     ベクトル検索のパフォーマンス最適化サービス
@@ -34,7 +36,7 @@ class VectorSearchOptimizationService:
         """Redisクライアントの初期化"""
         try:
             if hasattr(settings, 'REDIS_URL') and settings.REDIS_URL:
-                return redis.from_url(settings.REDIS_URL, decode_responses=True)
+                return redis.Redis(connection_pool=get_redis_pool())
             else:
                 # Redis未設定の場合はキャッシュなしで動作
                 logger.warning("Redis未設定のため、キャッシュ機能は無効です")
@@ -117,7 +119,7 @@ class VectorSearchOptimizationService:
             result = db.execute(
                 text(optimized_query),
                 {
-                    "query_vector": query_vector.tolist(),
+                    "query_vector": query_vector.astype(np.float16).tolist(),
                     "top_k": top_k,
                     "similarity_threshold": similarity_threshold,
                     **self._prepare_filter_params(filters)
@@ -145,12 +147,16 @@ class VectorSearchOptimizationService:
             v.chunk_text,
             v.session_metadata,
             v.created_at,
-            (v.embedding <=> :query_vector) as similarity_score
+            (v.embedding <=> CAST(:query_vector AS halfvec)) as similarity_score
         FROM success_conversation_vectors v
         """
         
         # フィルタ条件の追加
-        where_conditions = ["(v.embedding <=> :query_vector) <= :similarity_threshold"]
+        # is_success 条件で部分HNSWインデックスを利用可能にする
+        where_conditions = [
+            "v.is_success = true",
+            "(v.embedding <=> CAST(:query_vector AS halfvec)) <= :similarity_threshold"
+        ]
         
         if filters:
             if filters.get('success_rate_min'):
@@ -166,7 +172,7 @@ class VectorSearchOptimizationService:
         
         # 最適化されたORDER BYとLIMIT
         order_limit = """
-        ORDER BY v.embedding <=> :query_vector
+        ORDER BY v.embedding <=> CAST(:query_vector AS halfvec)
         LIMIT :top_k
         """
         
@@ -386,16 +392,23 @@ class VectorSearchOptimizationService:
             return
         
         try:
-            if pattern:
-                keys = self.redis_client.keys(f"vector_search:{pattern}*")
-                if keys:
-                    self.redis_client.delete(*keys)
-                    logger.info(f"{len(keys)}件のキャッシュエントリをクリア")
-            else:
-                keys = self.redis_client.keys("vector_search:*")
-                if keys:
-                    self.redis_client.delete(*keys)
-                    logger.info(f"全キャッシュ({len(keys)}件)をクリア")
+            # KEYS はRedisをブロックするため、SCANで少しずつ走査しUNLINKで非同期削除
+            match = f"vector_search:{pattern}*" if pattern else "vector_search:*"
+            deleted = 0
+            batch = []
+            for key in self.redis_client.scan_iter(match=match, count=500):
+                batch.append(key)
+                if len(batch) >= 500:
+                    deleted += self.redis_client.unlink(*batch)
+                    batch = []
+            if batch:
+                deleted += self.redis_client.unlink(*batch)
+            
+            if deleted:
+                if pattern:
+                    logger.info(f"{deleted}件のキャッシュエントリをクリア")
+                else:
+                    logger.info(f"全キャッシュ({deleted}件)をクリア")
                     
         except Exception as e:
             logger.error(f"キャッシュクリアでエラー: {e}")
@@ -58,7 +58,8 @@ class VectorSearchService:
         """
         try:
             # ベクトル検索クエリを構築
-            query_vector = f"[{','.join(map(str, query_embedding))}]"
+            # 保存側と同じく float16 に量子化して halfvec として比較
+            query_vector = f"[{','.join(map(str, np.asarray(query_embedding, dtype=np.float16).tolist()))}]"
             
             # 基本のSQLクエリ（ベクトルDBのテーブルのみ使用）
             base_query = """
@@ -69,7 +70,7 @@ class VectorSearchService:
                 scv.counselor_name,
                 scv.created_at,
                 scv.is_success,
-                (1 - (scv.embedding <=> %s::vector)) as similarity_score
+                (1 - (scv.embedding <=> %s::halfvec)) as similarity_score
             FROM success_conversation_vectors scv
             WHERE scv.is_success = true
             """
@@ -91,8 +92,8 @@ class VectorSearchService:
             
             # 類似度フィルタと並び替え
             base_query += f"""
-            AND (1 - (scv.embedding <=> %s::vector)) >= %s
-            ORDER BY scv.embedding <=> %s::vector
+            AND (1 - (scv.embedding <=> %s::halfvec)) >= %s
+            ORDER BY scv.embedding <=> %s::halfvec
             LIMIT %s
             """
             params.extend([query_vector, similarity_threshold, query_vector, top_k])
@@ -325,8 +326,8 @@ class SimilarityCalculator:
     @staticmethod
     def cosine_similarity(vec1: List[float], vec2: List[float]) -> float:
         """コサイン類似度計算"""
-        vec1_np = np.array(vec1)
-        vec2_np = np.array(vec2)
+        vec1_np = np.asarray(vec1, dtype=np.float32)
+        vec2_np = np.asarray(vec2, dtype=np.float32)
         
         dot_product = np.dot(vec1_np, vec2_np)
         norm1 = np.linalg.norm(vec1_np)
@@ -335,14 +336,14 @@ class SimilarityCalculator:
         if norm1 == 0 or norm2 == 0:
             return 0.0
         
-        return dot_product / (norm1 * norm2)
+        return float(dot_product / (norm1 * norm2))
     
     @staticmethod
     def euclidean_distance(vec1: List[float], vec2: List[float]) -> float:
         """ユークリッド距離計算"""
-        vec1_np = np.array(vec1)
-        vec2_np = np.array(vec2)
-        return np.linalg.norm(vec1_np - vec2_np)
+        vec1_np = np.asarray(vec1, dtype=np.float32)
+        vec2_np = np.asarray(vec2, dtype=np.float32)
+        return float(np.linalg.norm(vec1_np - vec2_np))
 
 
 # ユーティリティ関数
@@ -1,13 +1,19 @@
 from typing import Dict, List
 from fastapi import WebSocket
-import json
+import asyncio
 import logging
+import time
+import orjson
 
 logger = logging.getLogger(__name__)
 
+# Minimum seconds between intermediate progress pushes for one session
+PROGRESS_MIN_INTERVAL = 1.0
+
 class ConnectionManager:
     def __init__(self):
         self.active_connections: Dict[str, List[WebSocket]] = {}
+        self._last_progress_sent: Dict[str, float] = {}
 
     async def connect(self, websocket: WebSocket, session_id: str):
         await websocket.accept()
@@ -22,21 +28,35 @@ class ConnectionManager:
                 self.active_connections[session_id].remove(websocket)
             if not self.active_connections[session_id]:
                 del self.active_connections[session_id]
+                self._last_progress_sent.pop(session_id, None)
         logger.info(f"WebSocket disconnected for session {session_id}")
 
     async def send_personal_message(self, message: dict, session_id: str):
         if session_id in self.active_connections:
-            disconnected_connections = []
-            for connection in self.active_connections[session_id]:
+            # Serialize once for every subscriber of the session
+            await self.broadcast_batched(session_id, orjson.dumps(message))
+
+    async def broadcast_batched(self, session_id: str, payload: bytes, batch: int = 50):
+        """
+        Send a pre-serialized payload to all connections of a session,
+        yielding to the event loop between batches so large fan-outs
+        do not stall other requests
+        """
+        connections = list(self.active_connections.get(session_id, []))
+        disconnected_connections = []
+        for start in range(0, len(connections), batch):
+            if start:
+                await asyncio.sleep(0)
+            for connection in connections[start:start + batch]:
                 try:
-                    await connection.send_text(json.dumps(message))
+                    await connection.send_bytes(payload)
                 except Exception as e:
                     logger.error(f"Error sending message to {session_id}: {e}")
                     disconnected_connections.append(connection)
-            
-            # Clean up disconnected connections
-            for connection in disconnected_connections:
-                self.disconnect(connection, session_id)
+        
+        # Clean up disconnected connections
+        for connection in disconnected_connections:
+            self.disconnect(connection, session_id)
 
     async def send_transcription_update(self, session_id: str, status: str, data: dict = None):
         message = {
@@ -49,6 +69,15 @@ class ConnectionManager:
         await self.send_personal_message(message, session_id)
 
     async def send_progress_update(self, session_id: str, progress: int, stage: str, details: str = None):
+        if session_id not in self.active_connections:
+            return
+        # Throttle intermediate updates; start and completion always go out
+        now = time.monotonic()
+        if progress not in (0, 100):
+            if now - self._last_progress_sent.get(session_id, 0.0) < PROGRESS_MIN_INTERVAL:
+                return
+        self._last_progress_sent[session_id] = now
+        
         message = {
             "type": "progress_update",
             "session_id": session_id,
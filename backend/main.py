@@ -1,11 +1,15 @@
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+from sqlalchemy import text
 import logging
 
 from app.api.v1.api import api_router
 from app.core.config import settings
-from app.core.database import create_tables
+from app.db.session import create_tables, engine, vector_engine
+from app.services.transcription.speaker_diarization import speaker_diarization_service
+from app.services.transcription.whisper_service import whisper_service
 
 # Configure logging
 logging.basicConfig(
@@ -18,15 +22,24 @@ async def lifespan(app: FastAPI):
     # Startup
     # Tables are managed by Alembic migrations
     # create_tables()
+    # Open one pooled connection per engine so the first request skips the handshake
+    for db_engine in (engine, vector_engine):
+        try:
+            with db_engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
+        except Exception as e:
+            logging.getLogger(__name__).warning(f"Database warm-up failed: {e}")
+    speaker_diarization_service.warmup()
     yield
     # Shutdown
-    pass
+    await whisper_service.aclose()
 
 app = FastAPI(
     title="Counseling Support API",
     version="1.0.0",
     description="美容医療クリニック向けカウンセリングスクリプト改善AIツール",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # Configure CORS
@@ -13,6 +13,8 @@ interface WebSocketMessage {
   timestamp?: string;
 }
 
+const textDecoder = new TextDecoder();
+
 interface UseWebSocketProps {
   sessionId: string;
   enabled?: boolean;
@@ -48,6 +50,8 @@ export const useWebSocket = ({
         ? `${process.env.NEXT_PUBLIC_WS_URL}/ws/${sessionId}`
         : `ws://${window.location.host}/api/v1/ws/${sessionId}`;
       const ws = new WebSocket(wsUrl);
+      // サーバーはJSONをバイナリフレームでも送信するため、ArrayBufferとして受け取る
+      ws.binaryType = 'arraybuffer';
 
       ws.onopen = () => {
         setIsConnected(true);
@@ -58,7 +62,10 @@ export const useWebSocket = ({
 
       ws.onmessage = (event) => {
         try {
-          const message: WebSocketMessage = JSON.parse(event.data);
+          const payload = typeof event.data === 'string'
+            ? event.data
+            : textDecoder.decode(event.data as ArrayBuffer);
+          const message: WebSocketMessage = JSON.parse(payload);
           setLastMessage(message);
           if (onMessage) onMessage(message);
         } catch (error) {
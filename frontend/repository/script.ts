@@ -70,10 +70,14 @@ export interface ScriptsListResponse {
   total: number;
   limit: number;
   offset: number;
+  next_cursor?: string | null;
+  next_cursor_id?: string | null;
 }
 
 export const getScripts = async (params?: {
   offset?: number;
+  cursor?: string;
+  cursor_id?: string;
   limit?: number;
   status?: string;
 }): Promise<ScriptsListResponse> => {